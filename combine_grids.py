@@ -3,6 +3,8 @@ from inkex.deprecated import INKEX_DIR
 from networkx.algorithms.graphical import is_graphical
 from networkx.algorithms.operators.binary import union
 from .base import InkstitchExtension
+import functools
+import operator
 import sys
 from base64 import b64decode
 from argparse import ArgumentParser, REMAINDER
@@ -15,6 +17,8 @@ import wx.adv
 from lxml import etree
 
 from .create_grid import BoundingBoxMetadata
+from .intelligent_textiles_extension.pin_assignment import DeferredPinAssignment
+from .intelligent_textiles_extension.connectors import get_connector, is_connector, is_plain_pin
 
 class CombineGridsFrame(wx.Frame):
     DEFAULT_FONT = "small_font"
@@ -28,29 +32,36 @@ class CombineGridsFrame(wx.Frame):
 
 class Connector():
     '''
-    Object to represent connector of wires
+    Object to represent the connectors wires are routed to
     '''
-    def __init__(self, connector_pins, bbox):
-        self.connector_pins = connector_pins
-        self.points = [] # all coords where wires need to route to 
-        for pin in self.connector_pins:
-            points = [p for p in pin.path.end_points]
-            for p in points:
-                self.points.append(p)
-        self.connected_wire = [False for _ in range(len(points))]
-        self.open_wire_idx = 0 # idx of next available wire
-        self.bbox = bbox
-        self.num_pins = len(self.points) // 2
-    def connect_pins(self):
-        points = self.points[self.open_wire_idx : self.open_wire_idx + 4]
-        self.open_wire_idx += 4
-        return points
+    def __init__(self, connectors):
+        self.connectors = connectors # ConnectorModel of every selected connector
+        self.bbox = functools.reduce(operator.add, [c.bounding_box() for c in self.connectors])
+        self.num_pins = sum(c.num_pins for c in self.connectors)
+        self.is_reversed = False # wires enter pins from their last point
+        self.pin_requests = None
+    def connect_pins(self, wire_end):
+        '''
+        wire_end: 'x,y' point the wire leaves from towards the connector
+        returns placeholder for the pin points, swapped for the assigned pin by resolve_pins
+        '''
+        if self.pin_requests is None:
+            pins = [c.pin_points[:, ::-1] if self.is_reversed else c.pin_points for c in self.connectors]
+            self.pin_requests = DeferredPinAssignment(pins)
+        return self.pin_requests.request([float(v) for v in wire_end.split(',')])
 
-    def get_points(self):
-        return self.points[self.open_wire_idx:]
+    def resolve_pins(self, points):
+        '''
+        assigns pins to every wire end passed to connect_pins so traces are short and do not cross
+        '''
+        if self.pin_requests is None:
+            return points
+        points = self.pin_requests.fill(points, lambda x, y: '{},{}'.format(x, y))
+        self.pin_requests = None
+        return points
 
     def reverse_pins(self):
-        self.points = self.points[::-1]
+        self.is_reversed = not self.is_reversed
     
     def get_num_wire_joins(self, is_horizontal=True):# overloaded method for wire connection
          return 1 
@@ -251,9 +262,7 @@ class CombineGrids(InkstitchExtension):
 
             if wire_point_idx < len(union_wire_points):
                 if has_connector:
-                    connector_pins = self.connector.connect_pins()
-                    connector_points = ['{},{}'.format(p.x,p.y) for p in connector_pins]
-                    connection_points.extend(connector_points)
+                    connection_points.append(self.connector.connect_pins(connection_points[-1]))
                 else:
                     max_multiplier = max_wire.get_num_wire_joins(is_horizontal)
                     max_wire_splice_length = min(4 * max_multiplier, len(max_wire_points) - max_wire_idx)
@@ -264,9 +273,7 @@ class CombineGrids(InkstitchExtension):
                 endpoints = wires[-1].get_num_endpoints(is_horizontal)
                 if endpoints % 2 == 1:
                     if has_connector:
-                        connector_pins = self.connector.connect_pins()
-                        connector_points = ['{},{}'.format(p.x,p.y) for p in connector_pins]
-                        connection_points.extend(connector_points)
+                        connection_points.append(self.connector.connect_pins(connection_points[-1]))
                     else:
                         max_multiplier = max_wire.get_num_wire_joins(is_horizontal)
                         max_wire_splice_length = min(4 * max_multiplier, len(max_wire_points) - max_wire_idx)
@@ -275,7 +282,9 @@ class CombineGrids(InkstitchExtension):
                         connection_points.extend(max_points)
 
         # return union_wire_points # to debug wire unions
-        if not has_connector:
+        if has_connector:
+            connection_points = self.connector.resolve_pins(connection_points)
+        else:
             max_wire.wire.getparent().remove(max_wire.wire)
 
         # return union_wire_points
@@ -296,20 +305,16 @@ class CombineGrids(InkstitchExtension):
         return path
 
     def effect(self):
-        connector_pins = []
-        connector_bbox = None
+        connectors = []
         for elem in self.svg.get_selected():
             if type(elem) == Polyline:
                 wire = Wire(elem)
                 self.wires.append(wire)
-            elif type(elem) == PathElement: #connector
-                connector_bbox = elem.bounding_box()
-                points = [p for p in elem.path.end_points]
-                if len(points) == 4:
-                    connector_pins.append(elem)
-
-        if connector_bbox is not None:
-            self.connector = Connector(connector_pins, connector_bbox)
+            elif is_connector(elem) or is_plain_pin(elem):
+                connectors.append(get_connector(elem))
+
+        if len(connectors) != 0:
+            self.connector = Connector(connectors)
 
         if len(self.wires) == 2 and self.connector is None:
             self.pair_wires_horizontally() if self.is_horizontal_connection else self.pair_wires_vertically()
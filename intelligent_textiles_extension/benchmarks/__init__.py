@@ -0,0 +1,13 @@
+import os
+import sys
+
+'''
+Performance checks for the extension scripts
+Run from the intelligent_textiles_extension folder, e.g. python -m benchmarks.import_time
+'''
+
+EXTENSION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the extension scripts import each other as top level modules
+if EXTENSION_DIR not in sys.path:
+    sys.path.insert(0, EXTENSION_DIR)
@@ -0,0 +1,89 @@
+import sys
+from argparse import ArgumentParser
+import numpy as np
+from benchmarks.workers import BENCHMARKS, run_benchmarks
+
+'''
+Guards how the workers scale rather than how fast they are on one machine
+
+Every operation is timed on synthetic inputs of doubling size, keeping the fastest of several runs,
+and the growth exponent k of time ~ work^k is fitted on a log-log scale, where work is the number of
+steps the operation is meant to take for that size. An exponent near 1 means the operation scales
+as intended. Exits with status 1 if an exponent is above its bound, e.g. when a linear pass turns quadratic:
+
+    python -m benchmarks.complexity
+'''
+
+LINEAR_BOUND = 1.3 # allowed exponent of an operation meant to be linear in its work
+N_LOG_N_BOUND = 1.5 # allowed exponent of an operation meant to sort or index its work
+
+def wires(size):
+    return size
+
+
+def grid_area(size):
+    # size wires on each side of a grid, so wire length and stitches grow with its area
+    return size * size
+
+
+def wire_pairs(size):
+    return size * (size - 1) // 2
+
+
+def wire_lookups(size):
+    # 16 * size wires inserted and each looked up once, a lookup that scans every group shows up as size^2
+    return 16 * size
+
+
+# benchmark -> (sizes, runs per size, work for a size, highest allowed growth exponent)
+# sizes are the ones used by benchmarks.workers, see each benchmark for what they count
+COMPLEXITY_BOUNDS = {
+    'group_wires': ([32, 64, 128, 256, 512], 5, wires, LINEAR_BOUND),
+    'wiredb': ([128, 256, 512, 1024], 3, wire_lookups, LINEAR_BOUND),
+    # sympy intersection of every pair of routed wires
+    'has_valid_interpolation_points': ([2, 4, 8, 16], 3, wire_pairs, LINEAR_BOUND),
+    'stitch_segment': ([128, 256, 512, 1024], 5, grid_area, LINEAR_BOUND),
+    'stitch_curve': ([128, 256, 512, 1024], 5, grid_area, LINEAR_BOUND),
+    # wires are bucketed by the cells they cross in the spacing index
+    'create_grid': ([32, 64, 128, 256], 3, grid_area, N_LOG_N_BOUND),
+}
+
+def fit_exponent(work, seconds):
+    '''
+    slope of log(seconds) against log(work)
+    '''
+    slope, _ = np.polyfit(np.log(work), np.log(seconds), 1)
+    return float(slope)
+
+
+def check_complexity(names, slack=0.0):
+    '''
+    slack: added to every bound, for noisy machines
+    returns list of failure messages
+    '''
+    failures = []
+    for name in names:
+        sizes, repeats, work, bound = COMPLEXITY_BOUNDS[name]
+        runs = run_benchmarks([name], repeats, sizes)[name]
+        exponent = fit_exponent([work(run['size']) for run in runs], [run['seconds'] for run in runs])
+        print("{:<32} growth exponent {:.2f} (bound {:.2f})".format(name, exponent, bound + slack))
+        if exponent > bound + slack:
+            failures.append("{} grows as {}^{:.2f}, faster than the {}^{:.2f} bound".format(
+                name, work.__name__, exponent, work.__name__, bound + slack))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--benchmarks", type=str, default=','.join(COMPLEXITY_BOUNDS), help="Comma separated benchmarks to check")
+    parser.add_argument("--slack", type=float, default=0.0, help="Added to every bound")
+    args = parser.parse_args()
+    names = [name.strip() for name in args.benchmarks.split(',') if name.strip() != '']
+    unknown = [name for name in names if name not in COMPLEXITY_BOUNDS or name not in BENCHMARKS]
+    if len(unknown) != 0:
+        print("Unknown benchmarks: {}".format(', '.join(unknown)))
+        sys.exit(1)
+    failures = check_complexity(names, args.slack)
+    for failure in failures:
+        print("FAIL: {}".format(failure))
+    sys.exit(1 if len(failures) != 0 else 0)
@@ -0,0 +1,52 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from argparse import ArgumentParser
+from benchmarks.synthetic import generate_document
+from make_stitches import MakeStitchesWorker, PREVIEW_PNG
+
+'''
+Runs straight and curved synthetic grids through the whole make stitches worker,
+export, stats and preview included, and exits with status 1 if any output is missing:
+
+    python -m benchmarks.export_check
+'''
+
+EXPECTED_OUTPUTS = ['{}.dst', '{}.stats.json', '{}_preview.png']
+
+def check_export(size, is_curve):
+    '''
+    returns list of failure messages
+    '''
+    document = generate_document(1, size, size, curved=is_curve)
+    wires = document.get_elements(document.horizontal_wire_ids + document.vertical_wire_ids)
+    name = 'check_{}_{}'.format('curve' if is_curve else 'straight', size)
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        stderr = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(stderr):
+                worker = MakeStitchesWorker(wires, is_curve, name + '.dst', work_dir, preview=PREVIEW_PNG, use_stitch_cache=False)
+                worker.run()
+        except Exception as e:
+            return ["{} failed: {!r}".format(name, e)]
+        for output in EXPECTED_OUTPUTS:
+            if not os.path.exists(os.path.join(work_dir, output.format(name))):
+                failures.append("{} did not write {}".format(name, output.format(name)))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=str, default="4,16", help="Comma separated grid sizes to export")
+    args = parser.parse_args()
+    failures = []
+    for size in [int(size) for size in args.sizes.split(',') if size.strip() != '']:
+        for is_curve in (False, True):
+            failures.extend(check_export(size, is_curve))
+    for failure in failures:
+        print("FAIL: {}".format(failure))
+    print("export check {}".format('failed' if len(failures) != 0 else 'passed'))
+    sys.exit(1 if len(failures) != 0 else 0)
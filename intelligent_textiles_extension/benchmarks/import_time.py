@@ -0,0 +1,78 @@
+import subprocess
+import sys
+from argparse import ArgumentParser
+from benchmarks import EXTENSION_DIR
+
+'''
+Import time budget for every .inx entry point, measured with python -X importtime
+Inkscape starts a new interpreter for every effect, so this is paid on every click
+
+Exits with status 1 if an entry point goes over its budget or imports a module
+that should only be loaded lazily
+'''
+
+# entry point -> budget in milliseconds for importing it (cumulative, including inkex)
+BUDGETS_MS = {
+    'create_grid': 400,
+    'create_custom_grid': 400,
+    'combine_grids': 400,
+    'make_stitches': 500,
+}
+
+# heavy modules that must only be imported on the code paths that need them
+LAZY_MODULES = ['matplotlib', 'sympy', 'pyembroidery', 'turtle', 'bezier']
+
+def measure_import(module):
+    '''
+    returns (cumulative import time of module in ms, set of every module imported along with it)
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            cwd=EXTENSION_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("importing {} failed:\n{}".format(module, result.stderr))
+    cumulative_ms = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if not cumulative.strip().isdigit():
+            continue # header line
+        imported.add(name.split('.')[0])
+        if name == module:
+            cumulative_ms = int(cumulative) / 1000
+    return cumulative_ms, imported
+
+
+def check_import_budgets(repeats=3, scale=1.0):
+    '''
+    scale: multiplies every budget, for slower machines
+    returns list of failure messages
+    '''
+    failures = []
+    for module, budget in BUDGETS_MS.items():
+        times = []
+        imported = set()
+        for _ in range(repeats):
+            ms, imported = measure_import(module)
+            times.append(ms)
+        best = min(times)
+        print("{:<20} {:>8.1f} ms (budget {:.0f} ms)".format(module, best, budget * scale))
+        if best > budget * scale:
+            failures.append("{} took {:.1f} ms to import, over its {:.0f} ms budget".format(module, best, budget * scale))
+        for lazy in LAZY_MODULES:
+            if lazy in imported:
+                failures.append("{} imports {} at load time".format(module, lazy))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3, help="Imports per entry point, the fastest is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier applied to every budget")
+    args = parser.parse_args()
+    failures = check_import_budgets(args.repeats, args.scale)
+    for failure in failures:
+        print("FAIL: {}".format(failure))
+    sys.exit(1 if len(failures) != 0 else 0)
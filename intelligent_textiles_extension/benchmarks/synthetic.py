@@ -0,0 +1,146 @@
+from argparse import ArgumentParser
+import inkex
+
+'''
+Synthetic sensor grid documents for the benchmarks
+
+A document is a row of grids laid out left to right, each with horizontal and vertical wires,
+optional interpolation (custom routing) wires between the first two grids and optional connectors
+to the right of the last grid. Wire ids are predictable so wire groups can be written to the wire database
+'''
+
+WIRE_PITCH = 12 # px between neighbouring wires, wider than the minimum grid spacing
+GRID_GAP = 60 # px between neighbouring grids
+PIN_PITCH = 4 # px between connector pins
+WIRE_STYLE = "stroke: {}; stroke-width: 0.4; fill: none; stroke-dasharray:0.4,0.4"
+
+SVG_TEMPLATE = '''<svg xmlns="http://www.w3.org/2000/svg" xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+     width="{width}" height="{height}" viewBox="0 0 {width} {height}">
+<g id="layer1" inkscape:groupmode="layer" inkscape:label="Layer 1">
+{elements}
+</g>
+</svg>'''
+
+class SyntheticDocument():
+    '''
+    svg: root of the generated document
+    wire_groups: list of wire id lists, one per grid direction, as create_grid would store them
+    horizontal_wire_ids / vertical_wire_ids / interpolation_wire_ids / connector_ids: element ids by role
+    '''
+    def __init__(self, svg, wire_groups, horizontal_wire_ids, vertical_wire_ids, interpolation_wire_ids, connector_ids):
+        self.svg = svg
+        self.wire_groups = wire_groups
+        self.horizontal_wire_ids = horizontal_wire_ids
+        self.vertical_wire_ids = vertical_wire_ids
+        self.interpolation_wire_ids = interpolation_wire_ids
+        self.connector_ids = connector_ids
+
+    def get_elements(self, ids):
+        return [self.svg.getElementById(elem_id) for elem_id in ids]
+
+
+def format_path(points, curved=False):
+    '''
+    points: list of (x, y)
+    curved wires bow every segment out sideways with a cubic bezier
+    '''
+    path_str = 'M {},{}'.format(*points[0])
+    for (x1, y1), (x2, y2) in zip(points[:-1], points[1:]):
+        if curved:
+            bow = WIRE_PITCH / 4
+            path_str += ' C {},{} {},{} {},{}'.format(x1 + (x2 - x1) / 3 + bow, y1 + (y2 - y1) / 3 + bow,
+                                                     x1 + 2 * (x2 - x1) / 3 - bow, y1 + 2 * (y2 - y1) / 3 - bow, x2, y2)
+        else:
+            path_str += ' L {},{}'.format(x2, y2)
+    return path_str
+
+
+def path_element(elem_id, points, color, curved=False):
+    return '<path id="{}" style="{}" d="{}"/>'.format(elem_id, WIRE_STYLE.format(color), format_path(points, curved))
+
+
+def grid_wire_points(left, top, num_horizontal_wires, num_vertical_wires):
+    '''
+    returns (horizontal wires, vertical wires) of a grid with its upper left corner at (left, top),
+    every wire as [(x, y) start, (x, y) end]
+    '''
+    width = (num_vertical_wires + 1) * WIRE_PITCH
+    height = (num_horizontal_wires + 1) * WIRE_PITCH
+    horizontal = [[(left, top + (i + 1) * WIRE_PITCH), (left + width, top + (i + 1) * WIRE_PITCH)] for i in range(num_horizontal_wires)]
+    vertical = [[(left + (i + 1) * WIRE_PITCH, top), (left + (i + 1) * WIRE_PITCH, top + height)] for i in range(num_vertical_wires)]
+    return horizontal, vertical
+
+
+def generate_document(num_grids=1, num_horizontal_wires=4, num_vertical_wires=4,
+                      num_interpolation_wires=0, num_connectors=0, curved=False):
+    '''
+    num_interpolation_wires: custom routing wires from the right end of evenly spread horizontal wires
+    of the first grid to the matching wires of the second grid, 0 or at least 2
+    curved: lay grid wires as cubic beziers instead of straight lines
+    '''
+    grid_width = (num_vertical_wires + 1) * WIRE_PITCH
+    grid_height = (num_horizontal_wires + 1) * WIRE_PITCH
+    elements = []
+    wire_groups = []
+    horizontal_wire_ids = []
+    vertical_wire_ids = []
+    grid_horizontal_wires = []
+    for g in range(num_grids):
+        left = GRID_GAP + g * (grid_width + GRID_GAP)
+        horizontal, vertical = grid_wire_points(left, GRID_GAP, num_horizontal_wires, num_vertical_wires)
+        grid_horizontal_wires.append(horizontal)
+        h_ids = ['grid{}-h{}'.format(g, i) for i in range(len(horizontal))]
+        v_ids = ['grid{}-v{}'.format(g, i) for i in range(len(vertical))]
+        elements.extend(path_element(elem_id, points, 'red', curved) for elem_id, points in zip(h_ids, horizontal))
+        elements.extend(path_element(elem_id, points, 'blue', curved) for elem_id, points in zip(v_ids, vertical))
+        for ids in (h_ids, v_ids):
+            if len(ids) != 0:
+                wire_groups.append(ids)
+        horizontal_wire_ids.extend(h_ids)
+        vertical_wire_ids.extend(v_ids)
+
+    interpolation_wire_ids = []
+    if num_interpolation_wires != 0 and num_grids >= 2 and num_horizontal_wires >= 2:
+        num_interpolation_wires = max(2, min(num_interpolation_wires, num_horizontal_wires))
+        step = (num_horizontal_wires - 1) / (num_interpolation_wires - 1)
+        for i in range(num_interpolation_wires):
+            wire_idx = int(round(i * step))
+            start = grid_horizontal_wires[0][wire_idx][1]
+            end = grid_horizontal_wires[1][wire_idx][0]
+            points = [start, (start[0] + GRID_GAP / 3, start[1]), (start[0] + 2 * GRID_GAP / 3, end[1]), end]
+            elem_id = 'interp{}'.format(i)
+            elements.append(path_element(elem_id, points, 'green'))
+            interpolation_wire_ids.append(elem_id)
+
+    connector_ids = []
+    connectors_left = GRID_GAP + num_grids * (grid_width + GRID_GAP)
+    num_pins = num_horizontal_wires + num_vertical_wires
+    for c in range(num_connectors):
+        top = GRID_GAP + c * (num_pins * PIN_PITCH + GRID_GAP)
+        pins = [path_element('connector{}-pin{}'.format(c, p), [(connectors_left, top + p * PIN_PITCH), (connectors_left + PIN_PITCH, top + p * PIN_PITCH)], 'black')
+                for p in range(num_pins)]
+        elements.append('<g id="connector{}">{}</g>'.format(c, ''.join(pins)))
+        connector_ids.append('connector{}'.format(c))
+
+    width = connectors_left + (2 * GRID_GAP if num_connectors != 0 else 0)
+    height = max(grid_height, num_connectors * (num_pins * PIN_PITCH + GRID_GAP)) + 2 * GRID_GAP
+    svg_str = SVG_TEMPLATE.format(width=width, height=height, elements='\n'.join(elements))
+    svg = inkex.load_svg(svg_str.encode('utf-8')).getroot()
+    return SyntheticDocument(svg, wire_groups, horizontal_wire_ids, vertical_wire_ids, interpolation_wire_ids, connector_ids)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("output", type=str, help="Where to write the svg")
+    parser.add_argument("--grids", type=int, default=2)
+    parser.add_argument("--horizontal_wires", type=int, default=8)
+    parser.add_argument("--vertical_wires", type=int, default=8)
+    parser.add_argument("--interpolation_wires", type=int, default=0)
+    parser.add_argument("--connectors", type=int, default=0)
+    parser.add_argument("--curved", action='store_true')
+    args = parser.parse_args()
+    document = generate_document(args.grids, args.horizontal_wires, args.vertical_wires,
+                                 args.interpolation_wires, args.connectors, args.curved)
+    with open(args.output, 'wb') as f:
+        f.write(document.svg.tostring())
+    print("wrote {} with {} wire groups".format(args.output, len(document.wire_groups)))
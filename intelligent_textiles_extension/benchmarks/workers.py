@@ -0,0 +1,237 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from benchmarks import EXTENSION_DIR
+from benchmarks.synthetic import generate_document, WIRE_PITCH
+from create_grid import CreateGridWorker, BoundingBoxMetadata
+from combine_grids import CombineGridsWorker, InterpolationWires
+from make_stitches import MakeStitchesWorker
+from wiredb_proxy import WireDBProxy
+import path_flattener
+
+'''
+Benchmarks for the worker classes on synthetic documents of growing size
+Results are written as json so runs from different commits can be compared:
+
+    python -m benchmarks.workers --output before.json
+    python -m benchmarks.workers --output after.json --compare before.json
+
+--memory also records the peak memory allocated by every run, traced separately from the timed runs
+'''
+
+def time_call(setup, func, repeats, measure_memory=False):
+    '''
+    setup: called before every repeat, its result is passed to func and not timed
+    returns dict with the fastest of repeats runs of func in seconds,
+    and with measure_memory the peak bytes allocated by one more run of func
+    '''
+    best = None
+    for _ in range(repeats):
+        state = setup()
+        start = time.perf_counter()
+        func(state)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    result = {'seconds': best}
+    if measure_memory:
+        state = setup()
+        tracemalloc.start()
+        try:
+            func(state)
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def store_wire_groups(document):
+    wiredb_proxy = WireDBProxy()
+    for group in document.wire_groups:
+        wiredb_proxy.insert_new_wire_group(group)
+    return wiredb_proxy
+
+
+def bench_create_grid(size, repeats, measure_memory=False):
+    '''
+    size: wires in each direction of the new grid, laid next to an existing grid of the same size
+    '''
+    store_wire_groups(generate_document(1, size, size)) # only known wires are checked for spacing
+    def setup():
+        document = generate_document(1, size, size)
+        extent = (size + 1) * WIRE_PITCH
+        left = 3 * extent
+        rectangle = BoundingBoxMetadata(extent, extent, WIRE_PITCH, WIRE_PITCH + extent, left, left + extent)
+        return CreateGridWorker([], rectangle, size, size, document.svg)
+    return time_call(setup, lambda worker: worker.run(), repeats, measure_memory)
+
+
+def bench_group_wires(size, repeats, measure_memory=False):
+    '''
+    size: horizontal wires per grid, four grids
+    '''
+    document = generate_document(4, size, size)
+    store_wire_groups(document)
+    def setup():
+        worker = CombineGridsWorker(document.svg, True)
+        worker.wires = document.get_elements(document.horizontal_wire_ids)
+        return worker
+    return time_call(setup, lambda worker: worker.group_wires(worker.wires), repeats, measure_memory)
+
+
+def bench_connect_wires(size, repeats, measure_memory=False):
+    '''
+    size: horizontal wires per grid, two grids joined through two interpolation wires
+    includes the routing validation connect_wires runs at the end
+    '''
+    import sympy # the validator imports it lazily, keep the import out of the timings
+    document = generate_document(2, size, 2, num_interpolation_wires=2)
+    store_wire_groups(document)
+    def setup():
+        worker = CombineGridsWorker(document.svg, True)
+        worker.wires = document.get_elements(document.horizontal_wire_ids + document.interpolation_wire_ids)
+        wire_groups = worker.group_wires(worker.wires)
+        # same order CombineGridsWorker.run puts them in for horizontal connections
+        worker.interpolation_wires = sorted(worker.interpolation_wires, key=lambda w: -next(iter(w.path.end_points)).y)
+        worker.interp_wire_helper = InterpolationWires(worker.interpolation_wires, wire_groups)
+        return worker, wire_groups
+    return time_call(setup, lambda state: state[0].connect_wires(state[1]), repeats, measure_memory)
+
+
+def bench_has_valid_interpolation_points(size, repeats, measure_memory=False):
+    '''
+    size: number of parallel routed wires, each with four bends
+    '''
+    import sympy # the validator imports it lazily, keep the import out of the timings
+    wires = [[[x * WIRE_PITCH, i * WIRE_PITCH] for x in range(5)] for i in range(size)]
+    document = generate_document(0, 0, 0)
+    def setup():
+        return CombineGridsWorker(document.svg, True)
+    return time_call(setup, lambda worker: worker.has_valid_interpolation_points(wires), repeats, measure_memory)
+
+
+def bench_stitch_wires(size, repeats, is_curve, measure_memory=False):
+    '''
+    size: wires in each direction of one grid, stitched without the stitch cache
+    '''
+    document = generate_document(1, size, size, curved=is_curve)
+    wires = document.get_elements(document.horizontal_wire_ids + document.vertical_wire_ids)
+    def setup():
+        path_flattener.clear_cache()
+        return MakeStitchesWorker(wires, is_curve, 'benchmark.dst', '.', use_stitch_cache=False)
+    if is_curve:
+        return time_call(setup, lambda worker: worker.stitch_curve(), repeats, measure_memory)
+    return time_call(setup, lambda worker: worker.stitch_segment(), repeats, measure_memory)
+
+
+def bench_wiredb(size, repeats, measure_memory=False):
+    '''
+    size: number of wire groups of 16 wires, each group inserted and every wire looked up once
+    '''
+    groups = [['group{}-wire{}'.format(g, w) for w in range(16)] for g in range(size)]
+    def setup():
+        if os.path.exists('wire_db'):
+            os.remove('wire_db')
+        return WireDBProxy()
+    def run(wiredb_proxy):
+        for group in groups:
+            wiredb_proxy.insert_new_wire_group(group)
+        wiredb_proxy.retrieve_all_wire_groups()
+        for group in groups:
+            for wire_id in group:
+                wiredb_proxy.retrieve_wire_group_with_id(wire_id)
+    return time_call(setup, run, repeats, measure_memory)
+
+
+# benchmark name -> (function taking size, repeats and measure_memory, default sizes)
+BENCHMARKS = {
+    'create_grid': (bench_create_grid, [4, 8, 16, 32]),
+    'group_wires': (bench_group_wires, [4, 8, 16, 32]),
+    'connect_wires': (bench_connect_wires, [2, 4, 8]),
+    'has_valid_interpolation_points': (bench_has_valid_interpolation_points, [2, 4, 8]),
+    'stitch_segment': (lambda size, repeats, measure_memory: bench_stitch_wires(size, repeats, False, measure_memory), [4, 8, 16, 32]),
+    'stitch_curve': (lambda size, repeats, measure_memory: bench_stitch_wires(size, repeats, True, measure_memory), [4, 8, 16, 32]),
+    'wiredb': (bench_wiredb, [4, 8, 16, 32]),
+}
+
+def get_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=EXTENSION_DIR, capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def run_benchmarks(names, repeats, sizes=None, measure_memory=False):
+    '''
+    sizes: overrides every benchmark's default sizes
+    returns dict mapping benchmark name to list of {'size', 'seconds'} (and 'peak_bytes' with measure_memory)
+    '''
+    results = {}
+    old_cwd = os.getcwd()
+    for name in names:
+        func, default_sizes = BENCHMARKS[name]
+        results[name] = []
+        for size in (sizes or default_sizes):
+            # every run gets its own wire database, the workers print progress to stderr
+            with tempfile.TemporaryDirectory() as work_dir, contextlib.redirect_stderr(io.StringIO()):
+                os.chdir(work_dir)
+                try:
+                    result = func(size, repeats, measure_memory)
+                finally:
+                    os.chdir(old_cwd)
+            results[name].append(dict(size=size, **result))
+            memory_str = " {:>10.2f} MB".format(result['peak_bytes'] / 1e6) if 'peak_bytes' in result else ''
+            print("{:<32} size {:>5} {:>10.4f} s{}".format(name, size, result['seconds'], memory_str))
+    return results
+
+
+def compare_results(old_results, new_results):
+    '''
+    prints new / old time (and peak memory, if both runs measured it) for every benchmark and size present in both
+    '''
+    for name, runs in new_results.items():
+        old_runs = {run['size']: run for run in old_results.get(name, [])}
+        for run in runs:
+            old_run = old_runs.get(run['size'])
+            if old_run is None or old_run['seconds'] <= 0:
+                continue
+            memory_str = ''
+            if old_run.get('peak_bytes') and 'peak_bytes' in run:
+                memory_str = " {:>7.2f}x memory".format(run['peak_bytes'] / old_run['peak_bytes'])
+            print("{:<32} size {:>5} {:>7.2f}x time{}".format(name, run['size'], run['seconds'] / old_run['seconds'], memory_str))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--benchmarks", type=str, default=','.join(BENCHMARKS), help="Comma separated benchmarks to run")
+    parser.add_argument("--sizes", type=str, default="", help="Comma separated sizes, overrides the defaults")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per size, the fastest is kept")
+    parser.add_argument("--output", type=str, default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--compare", type=str, default="", help="Results file of an earlier run to compare against")
+    parser.add_argument("--memory", action='store_true', help="Also record the peak memory of every run")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.benchmarks.split(',') if name.strip() != '']
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if len(unknown) != 0:
+        print("Unknown benchmarks: {}".format(', '.join(unknown)))
+        sys.exit(1)
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip() != '']
+    results = run_benchmarks(names, args.repeats, sizes, args.memory)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeats': args.repeats,
+            'results': results,
+        }, f, indent=2)
+    print("results saved to:{}".format(args.output))
+    if args.compare != '':
+        with open(args.compare) as f:
+            compare_results(json.load(f)['results'], results)
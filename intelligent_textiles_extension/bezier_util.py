@@ -0,0 +1,52 @@
+import numpy as np
+
+'''
+Quadratic and cubic bezier helpers, vectorized over parameters and segments
+segments are arrays of shape (num_segments, degree + 1, 2)
+'''
+
+BINOMIALS = {
+    1: np.array([1., 1.]),
+    2: np.array([1., 2., 1.]),
+    3: np.array([1., 3., 3., 1.]),
+}
+
+def bernstein_basis(t, degree):
+    '''
+    returns array of shape (len(t), degree + 1) holding every bernstein polynomial at every t
+    '''
+    t = np.asarray(t, dtype='double').reshape(-1, 1)
+    k = np.arange(degree + 1)
+    return BINOMIALS[degree] * t ** k * (1 - t) ** (degree - k)
+
+
+def evaluate(segments, t):
+    '''
+    Evaluates every segment at every parameter in t
+    segments: array of shape (num_segments, 3 or 4, 2) for quadratics or cubics
+    returns array of shape (num_segments, len(t), 2)
+    '''
+    segments = np.asarray(segments, dtype='double')
+    basis = bernstein_basis(t, segments.shape[1] - 1)
+    return np.einsum('tk,skd->std', basis, segments)
+
+
+def derivative(segments, t):
+    '''
+    First derivative of every segment at every parameter in t, same shape as evaluate
+    '''
+    segments = np.asarray(segments, dtype='double')
+    degree = segments.shape[1] - 1
+    hodograph = degree * np.diff(segments, axis=1) # control points of the derivative curve
+    return evaluate(hodograph, t)
+
+
+def arc_lengths(segments, num_nodes=8):
+    '''
+    Length of every segment using gauss-legendre quadrature of the speed |B'(t)|
+    returns array of shape (num_segments,)
+    '''
+    nodes, weights = np.polynomial.legendre.leggauss(num_nodes)
+    t = (nodes + 1) / 2 # map from [-1, 1] to [0, 1]
+    speed = np.linalg.norm(derivative(segments, t), axis=2)
+    return speed @ weights / 2
@@ -1,11 +1,9 @@
 from argparse import ArgumentParser
-from ast import Return
-from tokenize import group
 import inkex
-from inkex import Polyline, PathElement
+from inkex import PathElement
 from lxml import etree
-from sympy import Segment, Point
 from wiredb_proxy import WireDBProxy
+import profiling
 import wire_util
 
 class Connector():
@@ -41,6 +39,8 @@ MIN_GRID_SPACING = inkex.units.convert_unit(1.5, "mm") # change this to user inp
 class CombineGridsEffect(inkex.Effect):
 	def add_arguments(self, pars):
 		pars.add_argument("--alignment", type=int, help="The type of connection to make")
+		pars.add_argument("--profile", type=inkex.Boolean, default=False, help="Write a timing trace next to the document")
+		pars.add_argument("--profile_memory", type=inkex.Boolean, default=False, help="Write peak memory and top allocation sites of every stage next to the document")
 	
 	def effect(self):
 		arg_parser = ArgumentParser()
@@ -49,7 +49,8 @@ class CombineGridsEffect(inkex.Effect):
 		is_horizontal_connection = True if args.alignment == 1 else False
 
 		combine_grids_worker = CombineGridsWorker(self.svg, is_horizontal_connection)
-		combine_grids_worker.run()
+		with profiling.session(profiling.get_mode(args.profile, args.profile_memory), self.document_path(), 'combine_grids'):
+			combine_grids_worker.run()
 
 
 class CombineGridsWorker():
@@ -61,6 +62,7 @@ class CombineGridsWorker():
 		self.interpolation_wires = [] # for custom combination routing
 		self.connector = None
 		self.wiredb_proxy = WireDBProxy()
+		self.id_allocator = wire_util.IdAllocator(svg)
 		self.interp_wire_helper = None
 
 
@@ -121,38 +123,42 @@ class CombineGridsWorker():
 	
 
 	def connect_wires(self, wire_groups_dict, interp_wires=None, interp_dict=None, interp_start_indices=None):
-		arranged_group_keys = self.arrange_wire_groups(wire_groups_dict)     # list of group ids sorted
+		with profiling.span('arrange wire groups'):
+			arranged_group_keys = self.arrange_wire_groups(wire_groups_dict)     # list of group ids sorted
 		wire_groups = [wire_groups_dict[k] for k in arranged_group_keys] # list of wire groups (which is a list of wires)
 		wire_lens = [len(w) for w in wire_groups] # list of (number of wires) for each wire group
 		wire_indices = [0 for _ in range(len(wire_groups))] # list of current wire indices for each wire group
 		generated_combined_wires = []
-		generated_ids = []
-		while wire_indices != wire_lens:
-			joint_wire_points = []
-			for wire_group_idx, curr_wire_idx in enumerate(wire_indices):
-				max_idx = wire_lens[wire_group_idx]
-				group_key = arranged_group_keys[wire_group_idx]
-				if curr_wire_idx != max_idx: # add the wire itself
-					current_wire = wire_groups[wire_group_idx][curr_wire_idx]
-					joint_wire_points.extend([[p.x, p.y] for p in current_wire.path.end_points])
-					wire_indices[wire_group_idx] += 1
-	
-				# range where interpolation routing is present
-				start, end = self.interp_wire_helper.is_in_group_interpolation_range(group_key, curr_wire_idx)
-				if start is not None: # we are in interpolation range!
-					interp_points = self.interp_wire_helper.get_custom_interpolation_route(group_key, start, end, curr_wire_idx)
-					joint_wire_points.extend(interp_points)
+		with profiling.span('route wires'):
+			while wire_indices != wire_lens:
+				joint_wire_points = []
+				for wire_group_idx, curr_wire_idx in enumerate(wire_indices):
+					max_idx = wire_lens[wire_group_idx]
+					group_key = arranged_group_keys[wire_group_idx]
+					if curr_wire_idx != max_idx: # add the wire itself
+						current_wire = wire_groups[wire_group_idx][curr_wire_idx]
+						joint_wire_points.extend([[p.x, p.y] for p in current_wire.path.end_points])
+						wire_indices[wire_group_idx] += 1
+		
+					# range where interpolation routing is present
+					start, end = self.interp_wire_helper.is_in_group_interpolation_range(group_key, curr_wire_idx)
+					if start is not None: # we are in interpolation range!
+						interp_points = self.interp_wire_helper.get_custom_interpolation_route(group_key, start, end, curr_wire_idx)
+						joint_wire_points.extend(interp_points)
 
-			generated_combined_wires.append(joint_wire_points)       
-			joint_wire_points = ['{},{}'.format(p[0],p[1]) for p in joint_wire_points]
-			elem = wire_util.create_path(self.svg, joint_wire_points, is_horizontal=self.is_horizontal_connection)
-			generated_ids.append(elem.get_id())
+				generated_combined_wires.append(joint_wire_points)
+
+		with profiling.span('write wires'):
+			new_wires = wire_util.create_paths(self.svg, generated_combined_wires, is_horizontal=self.is_horizontal_connection, id_allocator=self.id_allocator)
+			generated_ids = [elem.get_id() for elem in new_wires]
 
 		# generate new grouping of wires
-		self.wiredb_proxy.insert_new_wire_group(generated_ids)
+		with profiling.span('store wire group'):
+			self.wiredb_proxy.insert_new_wire_group(generated_ids)
 
 		# can move this block before to prevent drawing of wires
-		is_valid_routing = self.has_valid_interpolation_points(generated_combined_wires)
+		with profiling.span('validate routing'):
+			is_valid_routing = self.has_valid_interpolation_points(generated_combined_wires)
 		if not is_valid_routing:
 			inkex.errormsg("Please change your template routing wires.")
 			return
@@ -166,6 +172,7 @@ class CombineGridsWorker():
 		the minimum pitch between interpolation wires determined by MIN_GRID_SPACING 
 		but can easily be made a user input in the future
 		'''
+		from sympy import Segment, Point # sympy is slow to import, only load it when validating routes
 		for wire1 in generated_combined_wires:
 			for wire2 in generated_combined_wires:
 				if wire1 != wire2:
@@ -196,12 +203,14 @@ class CombineGridsWorker():
 
 	def run(self):
  
-		for elem in self.svg.get_selected():
-			if type(elem) == PathElement: #connector
-				points = [p for p in elem.path.end_points] 
-				self.wires.append(elem)
-
-		wire_groups = self.group_wires(self.wires)
+		with profiling.span('collect selected wires'):
+			for elem in self.svg.get_selected():
+				if type(elem) == PathElement: #connector
+					points = [p for p in elem.path.end_points] 
+					self.wires.append(elem)
+
+		with profiling.span('group wires'):
+			wire_groups = self.group_wires(self.wires)
 		if len(self.interpolation_wires) != 0: #custom connection			
 			# sort interpolation wires
 			interp_wire_points = []
@@ -224,12 +233,14 @@ class CombineGridsWorker():
 			self.interpolation_wires = tmp_interp_wires
 			# construct helper class to deal with custom routing logic 
 			self.interp_wire_helper = InterpolationWires(self.interpolation_wires, wire_groups)
-		self.connect_wires(wire_groups)
+		with profiling.span('connect wires'):
+			self.connect_wires(wire_groups)
 		
 		# remove old wires
-		old_wire_ids = [elem.get_id() for elem in self.svg.get_selected()]
-		# self.wiredb_proxy.delete_wire_groups_with_id(old_wire_ids)
-		for elem in self.svg.get_selected(): elem.getparent().remove(elem)
+		with profiling.span('remove old wires'):
+			old_wire_ids = [elem.get_id() for elem in self.svg.get_selected()]
+			# self.wiredb_proxy.delete_wire_groups_with_id(old_wire_ids)
+			for elem in self.svg.get_selected(): elem.getparent().remove(elem)
 		return
 
 	def create_path(self, points, is_horizontal):
@@ -275,8 +286,10 @@ class InterpolationWires():
 		self.group_connections = {}
 		#dict mapping g_key, start_idx, end_idx to list of interpolation points to use
 		self.interp_points_dict = {} 
-		self.determine_group_connections()
-		self.generate_interpolation_points()
+		with profiling.span('determine group connections'):
+			self.determine_group_connections()
+		with profiling.span('generate interpolation points'):
+			self.generate_interpolation_points()
 
 
 	def localize_interpolation_wire(self, start_point):
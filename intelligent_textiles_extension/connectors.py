@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import numpy as np
+from inkex import BoundingBox, Transform, Use
+
+'''
+Connectors described once in the document and parsed into arrays of pin coordinates
+
+A connector is a group, or a clone (<use>) of a symbol, marked with data-connector="<name>".
+Every pin inside it is a path marked with data-pin="<number>" and pins are ordered by that number.
+A wire is routed through the points of its pin in order, starting at the first one.
+Pin points are in document coordinates and cached by the connector's element id,
+so a connector is only parsed again once it changes.
+
+Plain 4 point paths are still taken as single pin connectors, as before connectors could be marked
+'''
+
+CONNECTOR_ATTRIBUTE = 'data-connector'
+PIN_ATTRIBUTE = 'data-pin'
+POINTS_PER_PIN = 4 # points of a plain pin path
+
+CONNECTOR_CACHE_SIZE = 256 # connectors kept parsed, least recently used ones are dropped first
+_connector_cache = OrderedDict() # maps element id to (signature, ConnectorModel)
+
+class ConnectorModel():
+    '''
+    pin_points: array of shape (num_pins, points_per_pin, 2)
+    '''
+    def __init__(self, elem_id, name, pin_points):
+        self.elem_id = elem_id
+        self.name = name
+        self.pin_points = pin_points
+
+    @property
+    def num_pins(self):
+        return len(self.pin_points)
+
+    def get_pin_positions(self):
+        '''
+        (num_pins, 2) array of the points wires are routed to
+        '''
+        return self.pin_points[:, 0] if self.num_pins != 0 else np.zeros((0, 2))
+
+    def bounding_box(self):
+        if self.num_pins == 0:
+            return BoundingBox()
+        points = self.pin_points.reshape(-1, 2)
+        low, high = points.min(axis=0), points.max(axis=0)
+        return BoundingBox((float(low[0]), float(high[0])), (float(low[1]), float(high[1])))
+
+
+def is_connector(elem):
+    return elem.get(CONNECTOR_ATTRIBUTE) is not None
+
+
+def is_plain_pin(elem):
+    '''
+    unmarked path with exactly 4 points
+    '''
+    return elem.TAG == 'path' and len(list(elem.path.end_points)) == POINTS_PER_PIN
+
+
+def get_pin_order(pin):
+    try:
+        return int(pin.get(PIN_ATTRIBUTE))
+    except ValueError:
+        return 0
+
+
+def get_transform_within(elem, root):
+    '''
+    transform from elem's coordinates to root's, not including root's own transform
+    '''
+    transform = Transform()
+    while elem is not None and elem is not root:
+        transform = Transform(elem.get('transform')) @ transform
+        elem = elem.getparent()
+    return transform
+
+
+def get_pin_source(elem):
+    '''
+    element holding the pins of a connector and the transform from its coordinates to the document's
+    '''
+    if isinstance(elem, Use):
+        symbol = elem.href
+        offset = Transform(translate=(float(elem.get('x', 0)), float(elem.get('y', 0))))
+        return symbol, elem.composed_transform() @ offset
+    return elem, elem.composed_transform()
+
+
+def get_signature(elem):
+    '''
+    everything the pin points of a connector depend on, cheap to build compared to parsing the pins
+    '''
+    source, transform = get_pin_source(elem)
+    if source is None:
+        return (str(transform),)
+    pins = tuple((pin.get('id'), pin.get(PIN_ATTRIBUTE), pin.get('d'), str(get_transform_within(pin, source)))
+                 for pin in source.iterdescendants() if pin.get(PIN_ATTRIBUTE) is not None)
+    return (elem.get(CONNECTOR_ATTRIBUTE), str(transform), pins)
+
+
+def parse_connector(elem):
+    source, transform = get_pin_source(elem)
+    pins = [] if source is None else [pin for pin in source.iterdescendants() if pin.get(PIN_ATTRIBUTE) is not None]
+    pins = sorted(pins, key=get_pin_order)
+    pin_points = []
+    for pin in pins:
+        pin_transform = transform @ get_transform_within(pin, source)
+        pin_points.append([(p.x, p.y) for p in pin.path.transform(pin_transform).end_points])
+    # pins may differ in point count, shorter ones repeat their last point
+    points_per_pin = max((len(points) for points in pin_points), default=0)
+    pin_points = [points + points[-1:] * (points_per_pin - len(points)) for points in pin_points]
+    return ConnectorModel(elem.get('id'), elem.get(CONNECTOR_ATTRIBUTE),
+                          np.asarray(pin_points, dtype='double').reshape(-1, points_per_pin, 2))
+
+
+def parse_plain_pin(elem):
+    points = [(p.x, p.y) for p in elem.path.transform(elem.composed_transform()).end_points]
+    return ConnectorModel(elem.get('id'), None, np.asarray(points, dtype='double').reshape(1, -1, 2))
+
+
+def get_connector(elem):
+    '''
+    ConnectorModel of a marked connector or a plain pin path, parsed once and cached by element id
+    '''
+    if is_connector(elem):
+        signature, parse = get_signature(elem), parse_connector
+    else:
+        signature, parse = (elem.get('d'), str(elem.composed_transform())), parse_plain_pin
+    elem_id = elem.get('id')
+    cached = _connector_cache.get(elem_id)
+    if cached is not None and cached[0] == signature:
+        _connector_cache.move_to_end(elem_id)
+        return cached[1]
+    connector = parse(elem)
+    if elem_id is not None:
+        _connector_cache[elem_id] = (signature, connector)
+        _connector_cache.move_to_end(elem_id)
+        if len(_connector_cache) > CONNECTOR_CACHE_SIZE:
+            _connector_cache.popitem(last=False)
+    return connector
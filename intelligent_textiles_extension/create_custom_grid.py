@@ -1,11 +1,6 @@
 from argparse import ArgumentParser
-from turtle import distance
 
 import inkex
-from inkex import Line, Rectangle, Path, Polyline
-from lxml import etree
-import pyembroidery
-import math
 from wiredb_proxy import WireDBProxy
 import wire_util
 
@@ -49,6 +44,7 @@ class CreateCustomGridWorker():
         self.svg = svg
         self.upper_left, self.lower_left, self.upper_right, self.lower_right = self.compute_corners()
         self.wiredb_proxy = WireDBProxy()
+        self.id_allocator = wire_util.IdAllocator(svg)
 
 
     def compute_corners(self):
@@ -139,19 +135,9 @@ class CreateCustomGridWorker():
     
 
     def lay_wire(self, wire1_points, wire2_points, is_horizontal):
-        wire1_idx = 0
-        wire2_idx = 0
-        wire_ids = []
-        while wire1_idx < len(wire1_points) and wire2_idx < len(wire2_points):
-            points = []
-            if wire1_idx < len(wire1_points):
-                points.append('{},{}'.format(wire1_points[wire1_idx][0], wire1_points[wire1_idx][1]))
-                wire1_idx += 1
-            if wire2_idx < len(wire2_points):
-                points.append('{},{}'.format(wire2_points[wire2_idx][0], wire2_points[wire2_idx][1]))
-                wire2_idx += 1
-            wire = wire_util.create_path(self.svg, points, is_horizontal)
-            wire_ids.append(wire.get_id())
+        wires = wire_util.create_paths(self.svg, [[p1, p2] for p1, p2 in zip(wire1_points, wire2_points)],
+                                       is_horizontal, id_allocator=self.id_allocator)
+        wire_ids = [wire.get_id() for wire in wires]
         inkex.errormsg("num wires generated:{} is horz:{}".format(len(wire_ids), is_horizontal))
         return wire_ids
 
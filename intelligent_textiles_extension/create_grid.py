@@ -1,12 +1,9 @@
 from argparse import ArgumentParser
 import inkex
-from inkex import Rectangle, Group
-from lxml import etree
-import pyembroidery
-import matplotlib.pyplot as plt
-import numpy as np
-import random
+from inkex import Rectangle
 from wiredb_proxy import WireDBProxy
+from spatial_index import SegmentIndex
+import profiling
 import wire_util
 
 MIN_GRID_SPACING = inkex.units.convert_unit(2.5, "mm")
@@ -43,6 +40,8 @@ class CreateGridEffect(inkex.Effect):
             help="The number of desired horizontal wires")
         pars.add_argument("--vertical_wires", type=str,\
             help="The number of desired vertical wires")
+        pars.add_argument("--profile", type=inkex.Boolean, default=False,\
+            help="Write a timing trace next to the document")
 
     def effect(self):
         arg_parser = ArgumentParser()
@@ -57,11 +56,13 @@ class CreateGridEffect(inkex.Effect):
         
         shape_points = None
         rectangle = None 
+        shape_id = None
         for elem in self.svg.get_selected(): # PATH ELEMENT
             units = "mm" if type(elem) == Rectangle else "px"
             shape_points = [p for p in elem.path.end_points]
             bbox = elem.bounding_box()
-            inkex.errormsg("ID:{}".format(elem.get_id()))
+            shape_id = elem.get_id()
+            inkex.errormsg("ID:{}".format(shape_id))
             rectangle = BoundingBoxMetadata(inkex.units.convert_unit(bbox.width, units),
                                             inkex.units.convert_unit(bbox.height, units),
                                             inkex.units.convert_unit(bbox.top, units),
@@ -69,23 +70,28 @@ class CreateGridEffect(inkex.Effect):
                                             inkex.units.convert_unit(bbox.left, units),
                                             inkex.units.convert_unit(bbox.right, units))
 
-        create_grid_worker = CreateGridWorker(shape_points, rectangle, int(args.horizontal_wires), int(args.vertical_wires), self.svg)
-        create_grid_worker.run()
+        create_grid_worker = CreateGridWorker(shape_points, rectangle, int(args.horizontal_wires), int(args.vertical_wires), self.svg, shape_id)
+        with profiling.session(profiling.get_mode(args.profile), self.document_path(), 'create_grid'):
+            create_grid_worker.run()
 
 class CreateGridWorker():
 
-    def __init__(self, shape_points, rectangle, num_horizontal_wires, num_vertical_wires, svg):
+    def __init__(self, shape_points, rectangle, num_horizontal_wires, num_vertical_wires, svg, shape_id=None):
         self.shape_points = shape_points
+        self.shape_id = shape_id # outline the grid is laid in, skipped by the document spacing check
         self.rectangle = rectangle
         self.num_horizontal_wires = num_horizontal_wires
         self.num_vertical_wires = num_vertical_wires
         self.svg = svg
         self.upper_left, self.upper_right,self.lower_left,self.lower_right = self.rectangle.get_rectangle_points()
         self.wiredb_proxy = WireDBProxy()
+        self.id_allocator = wire_util.IdAllocator(svg)
 
 
     def run(self):
         # check vertical and horizontal spacing
+        total_horizontal_spacing = None
+        total_vertical_spacing = None
         if self.num_horizontal_wires != 0:
             total_horizontal_spacing = self.rectangle.height / (self.num_horizontal_wires + 1)
             horizontal_wire_spacing = (self.rectangle.height - total_horizontal_spacing) / self.num_horizontal_wires
@@ -95,8 +101,6 @@ class CreateGridWorker():
                                 They are currently {} mm apart. Either decrease the
                                 number of wires or increase the size of the grid and try again.'''.format(MIN_GRID_SPACING, horizontal_wire_spacing))
                 return
-            horizontal_wire_ids = self.lay_horizontal_wires(total_horizontal_spacing)
-            self.wiredb_proxy.insert_new_wire_group(horizontal_wire_ids)
 
         if self.num_vertical_wires != 0:
             total_vertical_spacing = self.rectangle.width / (self.num_vertical_wires + 1)
@@ -107,45 +111,107 @@ class CreateGridWorker():
                                 They are currently {} mm apart. Either decrease the
                                 number of wires or increase the size of the grid and try again.'''.format(MIN_GRID_SPACING, vertical_wire_spacing))
                 return
-            vertical_wire_ids = self.lay_vertical_wires(total_vertical_spacing)
-            self.wiredb_proxy.insert_new_wire_group(vertical_wire_ids)
-        
 
-    # TODO: maybe combine these two functions
-    def lay_horizontal_wires(self, horizontal_wire_spacing):
+        # check new wires against wires already in the document before drawing anything
+        with profiling.span('check document spacing'):
+            planned_wires = []
+            if total_horizontal_spacing is not None:
+                planned_wires.extend(self.horizontal_wire_points(total_horizontal_spacing))
+            if total_vertical_spacing is not None:
+                planned_wires.extend(self.vertical_wire_points(total_vertical_spacing))
+            if not self.has_valid_document_spacing(planned_wires):
+                return
+
+        if total_horizontal_spacing is not None:
+            with profiling.span('lay horizontal wires'):
+                horizontal_wire_ids = self.lay_horizontal_wires(total_horizontal_spacing)
+            with profiling.span('store wire group'):
+                self.wiredb_proxy.insert_new_wire_group(horizontal_wire_ids)
+        if total_vertical_spacing is not None:
+            with profiling.span('lay vertical wires'):
+                vertical_wire_ids = self.lay_vertical_wires(total_vertical_spacing)
+            with profiling.span('store wire group'):
+                self.wiredb_proxy.insert_new_wire_group(vertical_wire_ids)
+
+    def build_document_wire_index(self):
+        '''
+        Indexes every wire segment already in the current layer, in the layer's coordinates
+        Only wires count: elements stored in the wire database or named by wire_util.IdAllocator,
+        the shape outline, connector pins and other artwork are skipped
+        '''
+        with profiling.span('index document wires'):
+            index = SegmentIndex(MIN_GRID_SPACING)
+            layer = self.svg.get_current_layer()
+            known_wire_ids = set(wire_id for group in self.wiredb_proxy.retrieve_all_wire_groups() for wire_id in group)
+            to_layer = -layer.composed_transform() # new wires are laid in layer coordinates
+            for elem in layer.xpath('.//svg:path | .//svg:polyline'):
+                elem_id = elem.get('id')
+                if elem_id == self.shape_id:
+                    continue
+                if elem_id not in known_wire_ids and not wire_util.is_generated_wire_id(elem_id):
+                    continue
+                path = elem.path.transform(to_layer @ elem.composed_transform())
+                points = [(p.x, p.y) for p in path.end_points]
+                index.insert_wire(points, elem_id)
+        return index
+
+    def has_valid_document_spacing(self, planned_wires):
+        '''
+        planned_wires: list of wires (list of (x, y) points) that are about to be laid
+
+        checks that no new wire crosses or runs closer than MIN_GRID_SPACING
+        to a wire that already exists in the layer
+        '''
+        index = self.build_document_wire_index()
+        if len(index.segments) == 0:
+            return True
+        violations = 0
+        conflicting_ids = set()
+        for wire_points in planned_wires:
+            hits = index.query_wire(wire_points)
+            if len(hits) != 0:
+                violations += 1
+                conflicting_ids.update(hits)
+        if violations != 0:
+            inkex.errormsg('''{} of the new wires would be closer than {} mm to existing wires ({}).
+                            Move the shape away from existing grids or change the number of wires and try again.'''.format(
+                                violations, MIN_GRID_SPACING, ', '.join(sorted(str(i) for i in conflicting_ids))))
+            return False
+        return True
+
+    def horizontal_wire_points(self, horizontal_wire_spacing):
+        '''
+        returns start and end point of every horizontal wire, bottom to top
+        '''
         curr_point = list(self.lower_left)
-        wire_count = 0
-        points = []
         wires = []
-        wire_ids = []
-        while wire_count != self.num_horizontal_wires:
+        for _ in range(self.num_horizontal_wires):
             curr_point[1] -= horizontal_wire_spacing
-            # if wire_count % 2 == 0:
-            points.append('{},{}'.format(self.rectangle.left - BBOX_SPACING, curr_point[1]))
-            points.append('{},{}'.format(self.rectangle.right, curr_point[1]))
-            elem = wire_util.create_path(self.svg, points, is_horizontal=True)
-            wires.append(elem)
-            wire_ids.append(elem.get_id())
-            points = []
-            wire_count += 1
-        return wire_ids
+            wires.append([(self.rectangle.left - BBOX_SPACING, curr_point[1]), (self.rectangle.right, curr_point[1])])
+        return wires
 
-    def lay_vertical_wires(self, vertical_wire_spacing):
+    def vertical_wire_points(self, vertical_wire_spacing):
+        '''
+        returns start and end point of every vertical wire, left to right
+        '''
         curr_point = list(self.upper_left)
-        wire_count = 0
-        points = []
         wires = []
-        wire_ids = []
-        while wire_count != self.num_vertical_wires:
+        for _ in range(self.num_vertical_wires):
             curr_point[0] += vertical_wire_spacing
-            points.append('{},{}'.format(curr_point[0], self.rectangle.top - BBOX_SPACING))
-            points.append('{},{}'.format(curr_point[0], self.rectangle.bottom))
-            elem = wire_util.create_path(self.svg, points, is_horizontal=False)
-            wires.append(elem)
-            wire_ids.append(elem.get_id())
-            points = []
-            wire_count += 1
-        return wire_ids
+            wires.append([(curr_point[0], self.rectangle.top - BBOX_SPACING), (curr_point[0], self.rectangle.bottom)])
+        return wires
+
+
+    # TODO: maybe combine these two functions
+    def lay_horizontal_wires(self, horizontal_wire_spacing):
+        wires = wire_util.create_paths(self.svg, self.horizontal_wire_points(horizontal_wire_spacing),
+                                       is_horizontal=True, id_allocator=self.id_allocator)
+        return [elem.get_id() for elem in wires]
+
+    def lay_vertical_wires(self, vertical_wire_spacing):
+        wires = wire_util.create_paths(self.svg, self.vertical_wire_points(vertical_wire_spacing),
+                                       is_horizontal=False, id_allocator=self.id_allocator)
+        return [elem.get_id() for elem in wires]
 
 if __name__ == '__main__':
     CreateGridEffect().run()
@@ -0,0 +1,23 @@
+import os
+import sqlite3
+
+'''
+Opens the sqlite databases of the wire groups and the stitch cache
+The worker daemon sets keep_connections so connections stay open between effects
+'''
+
+keep_connections = False
+_open_connections = {} # maps absolute database path to its open connection
+
+def connect(db_path):
+    if not keep_connections:
+        return sqlite3.connect(db_path)
+    db_path = os.path.abspath(db_path)
+    if db_path not in _open_connections:
+        _open_connections[db_path] = sqlite3.connect(db_path)
+    return _open_connections[db_path]
+
+
+def close(conn):
+    if not keep_connections:
+        conn.close()
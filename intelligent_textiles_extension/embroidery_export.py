@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+'''
+Writes one EmbPattern out to several embroidery formats at once
+'''
+
+# name of the pyembroidery writer used for each supported file extension
+# pyembroidery is only imported once something is written
+WRITERS = {
+    'dst': 'write_dst',
+    'pes': 'write_pes',
+    'exp': 'write_exp',
+    'jef': 'write_jef',
+    'vp3': 'write_vp3',
+}
+
+def parse_formats(format_str):
+    '''
+    format_str: comma separated list of extensions, e.g. "dst, .pes,exp"
+    returns list of lower case extensions without dots, in the order given and without duplicates
+    '''
+    formats = []
+    for fmt in (format_str or '').split(','):
+        fmt = fmt.strip().lstrip('.').lower()
+        if fmt != '' and fmt not in formats:
+            formats.append(fmt)
+    return formats
+
+
+def get_unsupported_formats(formats):
+    return [fmt for fmt in formats if fmt not in WRITERS]
+
+
+def write_format(pattern, path, fmt):
+    '''
+    returns (path, seconds taken, error message or None)
+    '''
+    import pyembroidery
+    start = time.perf_counter()
+    try:
+        getattr(pyembroidery, WRITERS[fmt])(pattern, path)
+    except Exception as e: # report the failure for this format without stopping the others
+        return path, time.perf_counter() - start, str(e)
+    return path, time.perf_counter() - start, None
+
+
+def export_pattern(pattern, dst_folder, base_name, formats):
+    '''
+    Writes pattern as dst_folder/base_name.<fmt> for every format, each in its own worker thread
+    The pattern is only read by the writers so it is shared between threads
+
+    returns dict mapping format to (path, seconds taken, error message or None)
+    '''
+    if len(formats) == 0:
+        return {}
+    paths = {fmt: '{}/{}.{}'.format(dst_folder, base_name, fmt) for fmt in formats}
+    with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+        futures = {fmt: executor.submit(write_format, pattern, paths[fmt], fmt) for fmt in formats}
+        return {fmt: futures[fmt].result() for fmt in formats}
@@ -1,4 +1,46 @@
+from functools import lru_cache
 import inkex
+from lxml import etree
+
+# element children only, comments and processing instructions never hold embroidery
+CHILD_ELEMENTS = etree.XPath("*")
+# urls of the elements command connectors end at
+COMMAND_TARGETS = etree.XPath("/svg:svg//svg:path/@inkscape:connection-end", namespaces=inkex.NSS)
+
+STYLE_CACHE_SIZE = 1024 # distinct style strings kept parsed, bounded for the long running worker daemon
+
+@lru_cache(maxsize=STYLE_CACHE_SIZE)
+def get_style_display(style):
+    '''
+    display property of a style attribute, parsed once for every distinct style string
+    '''
+    return inkex.Style(style).get('display')
+
+
+def get_stylesheet_display(svg):
+    '''
+    maps every element a stylesheet rule sets display on to that display,
+    the more specific rule wins and the later one among equally specific rules
+    '''
+    rules = []
+    for sheet in svg.stylesheets:
+        for rule in sheet:
+            if rule.get('display') is not None:
+                rules.append((max(rule.get_specificities(), default=(0, 0, 0)), len(rules), rule))
+    display = {}
+    for _, _, rule in sorted(rules, key=lambda r: r[:2]):
+        for elem in rule.all_matches(svg):
+            display[elem] = rule.get('display')
+    return display
+
+
+def get_display(node, stylesheet_display):
+    '''
+    display of the node itself, the style attribute wins over stylesheets and stylesheets over the presentation attribute
+    hidden ancestors are pruned before their children are reached, so they need no lookup
+    '''
+    return get_style_display(node.get('style', '')) or stylesheet_display.get(node) or node.get('display', 'inline')
+
 
 class InkstitchExtension(inkex.Effect):
     """Base class for Inkstitch extensions.  Not intended for direct use."""
@@ -24,50 +66,72 @@ class InkstitchExtension(inkex.Effect):
 
         inkex.errormsg(_("Tip: Run Extensions > Ink/Stitch > Troubleshoot > Troubleshoot Objects") + "\n")
 
-    def descendants(self, node, selected=False, troubleshoot=False):  # noqa: C901
+    def descendants(self, node, selected=False, troubleshoot=False):
+        '''
+        Embroiderable elements under node in post-order, walked with an explicit stack so
+        deep documents don't hit the recursion limit. Ignored layers, hidden groups, defs,
+        masks, clip paths and commands are pruned together with everything below them.
+        '''
         nodes = []
+        has_selection = bool(self.svg.selected)
+        # only elements a command connector ends at can carry ignore_object, look them up once
+        command_targets = set(url.lstrip('#') for url in COMMAND_TARGETS(node))
+        # stylesheets are matched against the document once instead of resolving every node's style
+        stylesheet_display = get_stylesheet_display(self.svg)
+
+        # (node, selected, collect): collect marks a node whose children were already pushed
+        stack = [(node, selected, False)]
+        while stack:
+            node, selected, collect = stack.pop()
+            if collect:
+                nodes.append(node)
+                continue
 
-        if node.tag == Comment:
-            return []
+            if self.is_pruned(node, command_targets, stylesheet_display):
+                continue
+
+            if not has_selection or node.get("id") in self.svg.selected:
+                # if the user didn't select anything that means we process everything
+                selected = True
 
-        element = EmbroideryElement(node)
+            if selected:
+                if node.tag == SVG_GROUP_TAG:
+                    pass
+                elif (node.tag in EMBROIDERABLE_TAGS or is_clone(node)) and not is_pattern(node):
+                    stack.append((node, selected, True))
+                # add images, text and patterns for the troubleshoot extension
+                elif troubleshoot and (node.tag in NOT_EMBROIDERABLE_TAGS or is_pattern(node)):
+                    stack.append((node, selected, True))
+
+            # reversed so the first child is walked first
+            stack.extend((child, selected, False) for child in reversed(CHILD_ELEMENTS(node)))
+
+        return nodes
+
+    def is_pruned(self, node, command_targets, stylesheet_display):
+        '''
+        True if node and everything below it is left out of descendants()
+        '''
+        if node.tag == Comment:
+            return True
 
-        if element.has_command('ignore_object'):
-            return []
+        if node.get("id") in command_targets and EmbroideryElement(node).has_command('ignore_object'):
+            return True
 
         if node.tag == SVG_GROUP_TAG and node.get(INKSCAPE_GROUPMODE) == "layer":
             if len(list(layer_commands(node, "ignore_layer"))):
-                return []
+                return True
 
-        if (node.tag in EMBROIDERABLE_TAGS or node.tag == SVG_GROUP_TAG) and element.get_style('display', 'inline') is None:
-            return []
+        if (node.tag in EMBROIDERABLE_TAGS or node.tag == SVG_GROUP_TAG) and get_display(node, stylesheet_display) == 'none':
+            return True
 
         # defs, masks and clippaths can contain embroiderable elements
         # but should never be rendered directly.
         if node.tag in [SVG_DEFS_TAG, SVG_MASK_TAG, SVG_CLIPPATH_TAG]:
-            return []
+            return True
 
         # command connectors with a fill color set, will glitch into the elements list
         if is_command(node) or node.get(CONNECTOR_TYPE):
-            return []
-
-        if self.svg.selected:
-            if node.get("id") in self.svg.selected:
-                selected = True
-        else:
-            # if the user didn't select anything that means we process everything
-            selected = True
-
-        for child in node:
-            nodes.extend(self.descendants(child, selected, troubleshoot))
-
-        if selected:
-            if node.tag == SVG_GROUP_TAG:
-                pass
-            elif (node.tag in EMBROIDERABLE_TAGS or is_clone(node)) and not is_pattern(node):
-                nodes.append(node)
-            # add images, text and patterns for the troubleshoot extension
-            elif troubleshoot and (node.tag in NOT_EMBROIDERABLE_TAGS or is_pattern(node)):
-                nodes.append(node)
+            return True
 
-        return nodes
\ No newline at end of file
+        return False
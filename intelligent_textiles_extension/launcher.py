@@ -0,0 +1,31 @@
+import sys
+import worker_daemon
+
+'''
+Entry point for the .inx files
+Forwards the effect to the resident worker daemon if one is running, otherwise runs it in this process
+'''
+
+def split_extension_arg(args):
+    '''
+    returns (effect name from --extension, remaining args)
+    '''
+    effect_name = None
+    remaining = []
+    for arg in args:
+        if arg.startswith('--extension='):
+            effect_name = arg.split('=', 1)[1]
+        else:
+            remaining.append(arg)
+    return effect_name, remaining
+
+
+if __name__ == '__main__':
+    effect_name, args = split_extension_arg(sys.argv[1:])
+    if effect_name not in worker_daemon.EFFECTS:
+        sys.stderr.write("Unknown extension: {}\n".format(effect_name))
+        sys.exit(1)
+    status = worker_daemon.forward(effect_name, args)
+    if status is None:
+        status = worker_daemon.run_effect(effect_name, args, None)
+    sys.exit(status)
@@ -1,26 +1,53 @@
 import inkex
-from inkex.paths import Path
-import pyembroidery
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 import numpy as np
-from matplotlib import pyplot as plt
-from lxml import etree
 import math
-from bezier import Curve # TODO: giving some binary issues! CRASHING PYTHON
+import os
+import embroidery_export
+import profiling
+import path_flattener
+import resampler
+import wire_order
+from stitch_buffer import StitchBuffer, STITCH, JUMP, PATTERN_UNITS_PER_MM
+from stitch_cache import StitchCache
+import stitch_stats
 
-'''
-ValueError: numpy.ndarray size changed, may indicate binary incompatibility. 
-Expected 88 from C header, got 80 from PyObject
-'''
+DEFAULT_STITCH_LENGTH = inkex.units.convert_unit('3mm', 'px')
+DEFAULT_MIN_STITCH_LENGTH = inkex.units.convert_unit('1mm', 'px')
+DEFAULT_MAX_STITCH_LENGTH = inkex.units.convert_unit('5mm', 'px')
+DEFAULT_MM_PER_UNIT = inkex.units.convert_unit('1px', 'mm')
 
-import simplepath
-import wire_util
+# stitch preview modes
+PREVIEW_NONE = 0
+PREVIEW_WINDOW = 1
+PREVIEW_PNG = 2
+PREVIEW_SVG = 3
+PREVIEW_LABEL_BUDGET = 50 # max number of stitch indices written on the preview
+
+DEFAULT_STITCHES_PER_MINUTE = 600 # machine speed used to estimate run time
+# seconds to stitch one segment in this process, by is_curve
+SEGMENT_STITCH_TIME = {True: 5e-6, False: 1.2e-6}
+# seconds to start a process pool and send it the segments, by start method, spawn re-imports numpy in every worker
+POOL_STARTUP_TIME = {'fork': 0.05, 'forkserver': 0.5, 'spawn': 0.5}
 
 class MakeStitchesEffect(inkex.Effect):
     def add_arguments(self, pars):
         pars.add_argument("--wire_type", type=int)
         pars.add_argument("--dst_folder", type=str)
         pars.add_argument("--file_name", type=str)
+        pars.add_argument("--stitch_length", type=float, default=3.0, help="Target stitch length in mm")
+        pars.add_argument("--min_stitch_length", type=float, default=1.0, help="Shortest allowed stitch in mm")
+        pars.add_argument("--max_stitch_length", type=float, default=5.0, help="Longest allowed stitch in mm")
+        pars.add_argument("--preview", type=int, default=PREVIEW_NONE, help="How to show the stitch preview")
+        pars.add_argument("--optimize_order", type=inkex.Boolean, default=True, help="Reorder wires to minimize jumps")
+        pars.add_argument("--stitches_per_minute", type=int, default=DEFAULT_STITCHES_PER_MINUTE, help="Machine speed for run time estimates")
+        pars.add_argument("--use_stitch_cache", type=inkex.Boolean, default=True, help="Reuse stitches of wires unchanged since an earlier export")
+        pars.add_argument("--clear_stitch_cache", type=inkex.Boolean, default=False, help="Empty the stitch cache before exporting")
+        pars.add_argument("--extra_formats", type=str, default="", help="Comma separated formats to write besides the file name's own")
+        pars.add_argument("--profile", type=inkex.Boolean, default=False, help="Write a timing trace next to the document")
+        pars.add_argument("--profile_memory", type=inkex.Boolean, default=False, help="Write peak memory and top allocation sites of every stage next to the document")
     
     def effect(self):
         arg_parser = ArgumentParser()
@@ -41,131 +68,227 @@ class MakeStitchesEffect(inkex.Effect):
         # wire_util.create_path(self.svg, points, False)
         
         is_curve = True if args.wire_type == 1 else False
-        make_stitches_worker = MakeStitchesWorker(wires, is_curve, args.file_name, args.dst_folder)
+        if args.clear_stitch_cache:
+            StitchCache().clear()
+        make_stitches_worker = MakeStitchesWorker(wires, is_curve, args.file_name, args.dst_folder,
+                                                  self.svg.unittouu('{}mm'.format(args.stitch_length)),
+                                                  self.svg.unittouu('{}mm'.format(args.min_stitch_length)),
+                                                  self.svg.unittouu('{}mm'.format(args.max_stitch_length)),
+                                                  args.preview,
+                                                  embroidery_export.parse_formats(args.extra_formats),
+                                                  args.optimize_order,
+                                                  args.stitches_per_minute,
+                                                  self.svg.uutounit(1.0, 'mm'),
+                                                  args.use_stitch_cache)
         inkex.errormsg("what is file path:{}".format(args.dst_folder))
-        make_stitches_worker.run()
+        with profiling.session(profiling.get_mode(args.profile, args.profile_memory), self.document_path(), 'make_stitches'):
+            make_stitches_worker.run()
 
 class MakeStitchesWorker(inkex.Effect):
-    def __init__(self, wires, is_curve, filename, dst_folder):
+    def __init__(self, wires, is_curve, filename, dst_folder, stitch_length=DEFAULT_STITCH_LENGTH,
+                 min_stitch_length=DEFAULT_MIN_STITCH_LENGTH, max_stitch_length=DEFAULT_MAX_STITCH_LENGTH, preview=PREVIEW_NONE,
+                 extra_formats=(), optimize_order=True, stitches_per_minute=DEFAULT_STITCHES_PER_MINUTE,
+                 mm_per_unit=DEFAULT_MM_PER_UNIT, use_stitch_cache=True):
         self.wires = wires
+        self.preview = preview
+        self.optimize_order = optimize_order
+        self.stitches_per_minute = stitches_per_minute
         inkex.errormsg("len wires:{}".format(len(wires)))
         self.is_curve = is_curve
+        # stitch lengths are in document units
+        self.stitch_length = stitch_length
+        self.min_stitch_length = min(min_stitch_length, stitch_length)
+        self.max_stitch_length = max(max_stitch_length, stitch_length)
+        self.mm_per_unit = mm_per_unit
+        # stitch points are scaled from document units to the pattern's 1/10 mm when the pattern is built
+        self.pattern_scale = PATTERN_UNITS_PER_MM * mm_per_unit
         self.filename = filename
-        if self.filename.split('.')[1] not in ['dst', 'pes', '.exp', '.jef', '.vp3']:
+        self.base_name, extension = os.path.splitext(self.filename)
+        # the file name's own format is always written, extra formats are written alongside it
+        self.formats = embroidery_export.parse_formats(','.join([extension] + list(extra_formats)))
+        unsupported_formats = embroidery_export.get_unsupported_formats(self.formats)
+        if extension == '' or len(unsupported_formats) != 0:
             inkex.errormsg("Pyembroidery only supports .dst, .pes, .exp, .jef, and .vp3 formats. Please change file type to save.")
+            self.formats = []
             return 
         self.dst_folder = dst_folder
 
-        self.end_points = []
-        for wire in wires:
-            self.end_points.append([p for p in wire.path.end_points])
-
-        self.wire_points = []
-        if self.is_curve:
-            for wire in wires:
-                points = []
-                path = simplepath.parsePath(wire.path)
-                for t, ele in path:
-                    for i in range(0,len(ele)-1,2):
-                        x = ele[i]
-                        y = ele[i+1]
-                        points.append([x,y])
-                self.wire_points.append(points)
-        else:
-            self.wire_points = self.end_points
-        
-    
-    def stitch_curve(self):
+        self.stitch_cache = StitchCache() if use_stitch_cache else None
+
+    def generate_stitches(self):
         '''
-        Bezier curves represented with 4 points
-        We can use them and a general parametric equation to generate stitch points
+        Stitch points of every wire, in wire order
+        Wires whose geometry and stitch settings have not changed since a previous export are read from the stitch cache
         '''
-        all_curves = []
-        for w in self.wire_points:
-            stitch_points = []
-
-            nodes = np.asfortranarray([
-                [p[0] for p in  w],
-                [p[1] for p in  w]
-            ]).astype('double')
+        if self.stitch_cache is None:
+            with profiling.span('parse wire paths'):
+                wire_segments = [path_flattener.get_cubic_segments(wire) for wire in self.wires]
+            with profiling.span('compute stitches'):
+                return self.compute_stitches(wire_segments)
+        with profiling.span('stitch cache lookup'):
+            keys = [StitchCache.make_key(path_flattener.get_path_data(wire), resampler.ALGORITHM_VERSION, self.is_curve,
+                                         self.stitch_length, self.min_stitch_length, self.max_stitch_length) for wire in self.wires]
+            cached = self.stitch_cache.retrieve_stitches(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        inkex.errormsg("stitch cache hits:{} of {}".format(len(keys) - len(missing), len(keys)))
+        # only wires missing from the cache are flattened to absolute cubic segments and stitched
+        with profiling.span('parse wire paths'):
+            wire_segments = [path_flattener.get_cubic_segments(self.wires[i]) for i in missing]
+        with profiling.span('compute stitches'):
+            computed = self.compute_stitches(wire_segments)
+        computed_dict = {keys[i]: stitches for i, stitches in zip(missing, computed)}
+        if len(computed_dict) != 0:
+            with profiling.span('stitch cache insert'):
+                self.stitch_cache.insert_stitches(computed_dict)
+        return [cached[key] if key in cached else computed_dict[key] for key in keys]
 
-            curve = Curve.from_nodes(nodes, copy=True)
+    def compute_stitches(self, wire_segments):
+        '''
+        Stitch points of every wire in wire_segments, in order
+        Large jobs are split into chunks of consecutive wires and stitched in a process pool,
+        small ones are stitched in this process to avoid paying for the pool startup
+        '''
+        stitch_args = (self.is_curve, self.stitch_length, self.min_stitch_length, self.max_stitch_length)
+        num_segments = sum(len(segments) for segments in wire_segments)
+        num_workers = min(os.cpu_count() or 1, len(wire_segments))
+        if num_workers < 2 or not self.is_worth_pool(num_segments, num_workers):
+            return resampler.stitch_wires(wire_segments, *stitch_args)
 
+        chunk_size = int(math.ceil(len(wire_segments) / (num_workers * 4)))
+        chunks = [wire_segments[i:i + chunk_size] for i in range(0, len(wire_segments), chunk_size)]
+        stitch_group = []
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            # map hands results back in chunk order
+            for points, sizes in executor.map(resampler.stitch_wires_packed, [(chunk,) + stitch_args for chunk in chunks]):
+                stitch_group.extend(resampler.unpack_wires(points, sizes))
+        return stitch_group
 
-            t = 0.01
-            point = curve.evaluate(t)
-            x = point[0][0]
-            y = point[1][0]
-            stitch_points.append([x,y])
-            for _ in range(99): # change this number to change pitch of stitches, may also convert to user input in the future
-                point = curve.evaluate(t)
-                x = point[0][0]
-                y = point[1][0]
-                stitch_points.append([x,y])
-                t += .01
+    def is_worth_pool(self, num_segments, num_workers):
+        '''
+        True if the time a pool of num_workers saves on num_segments is more than it takes to start
+        '''
+        serial_time = num_segments * SEGMENT_STITCH_TIME[self.is_curve]
+        startup_time = POOL_STARTUP_TIME.get(multiprocessing.get_context().get_start_method(), POOL_STARTUP_TIME['spawn'])
+        return serial_time * (1 - 1 / num_workers) > startup_time
 
-            all_curves.append(stitch_points)
-        return all_curves
+    def stitch_curve(self):
+        '''
+        Bezier curves represented with 4 points
+        Every segment is sampled densely and the result is walked by arc length to place stitches
+        '''
+        return self.generate_stitches()
 
     def stitch_segment(self):
-        
-        stitch_points = []
-        count = 0
-        for wire in self.wire_points:   
-            for i in range(len(wire) - 1):
-                p1 = wire[i]
-                p2 = wire[i+1]
-                # stitch_points.append([p1.x, p1.y])
-                line = [[p1.x, p1.y], [p2.x, p2.y]]
-                num_points = 3 # could make this a user input somehow?
-                line_points = [[p1.x, p1.y]] + wire_util.segment_line(line, num_points)
-                if count % 2 == 1:
-                    line_points = line_points[::-1]
-
-                stitch_points.append(line_points)
-            count += 1
+        stitch_points = self.generate_stitches()
+        for count in range(1, len(stitch_points), 2):
+            stitch_points[count] = stitch_points[count][::-1]
         return stitch_points
 
+    def order_wires(self, stitch_group):
+        '''
+        Reorders and flips wires to minimize jumps between them and reports the machine time saved
+        '''
+        stitch_group = [w for w in stitch_group if len(w) != 0]
+        if len(stitch_group) < 2:
+            return stitch_group
+        jumps_before = wire_order.get_jump_lengths(stitch_group)
+        ordered_group = wire_order.WireOrderOptimizer(stitch_group).optimize()
+        jumps_after = wire_order.get_jump_lengths(ordered_group)
+        time_before = wire_order.estimate_jump_time(jumps_before, self.max_stitch_length, self.stitches_per_minute)
+        time_after = wire_order.estimate_jump_time(jumps_after, self.max_stitch_length, self.stitches_per_minute)
+        inkex.errormsg("jump distance before:{:.1f} after:{:.1f}, estimated jump time before:{:.1f}s after:{:.1f}s (saved {:.1f}s)".format(
+            jumps_before.sum(), jumps_after.sum(), time_before, time_after, time_before - time_after))
+        return ordered_group
+
     def make_stitches(self, stitch_group):
-        pattern = pyembroidery.EmbPattern()
-        for stitch_points in stitch_group:
-            for x, y in stitch_points:
-                pattern.add_stitch_absolute(pyembroidery.STITCH, x, y)
-        pyembroidery.write_pes(pattern, '{}/{}'.format(self.dst_folder, self.filename))
-        self.visualize_stitches(pattern)
-
-
-    def visualize_stitches(self, pattern):
-        #visualize stitches
-        stitch_info = np.asarray(pattern.stitches)
-        #Extract info from np.array and convert to mm
-        x_coord = stitch_info[:,0]/10
-        y_coord = stitch_info[:,1]/10
-        num_of_stitches = len(x_coord)
-        #Plot the stitches
-        stitch_loc = plt.scatter(x_coord, y_coord, s = 1, c = 'black')
-
-        #Add label to every ith stitch
-        i = 0
-        while i <= num_of_stitches - 1: 
-            plt.annotate(i, (x_coord[i], y_coord[i]))
-            i += 10
+        with profiling.span('build pattern'):
+            import pyembroidery # only needed once there is a stitch plan to write
+            stitches = StitchBuffer(sum(len(stitch_points) for stitch_points in stitch_group))
+            for stitch_points in stitch_group:
+                if len(stitch_points) == 0:
+                    continue
+                # the machine jumps to the start of every wire and stitches the rest of it
+                stitches.append(stitch_points[:1] * self.pattern_scale, JUMP)
+                stitches.append(stitch_points[1:] * self.pattern_scale, STITCH)
+            pattern = stitches.to_pattern(pyembroidery.EmbPattern())
+        with profiling.span('export'):
+            results = embroidery_export.export_pattern(pattern, self.dst_folder, self.base_name, self.formats)
+        for fmt, (path, seconds, error) in results.items():
+            if error is not None:
+                inkex.errormsg("failed to write {}:{}".format(path, error))
+            else:
+                inkex.errormsg("wrote {} in {:.3f}s".format(path, seconds))
+        with profiling.span('stats'):
+            self.report_stats(stitches)
+        with profiling.span('preview'):
+            self.visualize_stitches(stitches)
+
+    def report_stats(self, stitches):
+        '''
+        Writes stitch count, thread length, run time etc. as json next to the embroidery file
+        '''
+        stats = stitch_stats.compute_stats(stitches.array, self.stitches_per_minute, self.max_stitch_length * self.mm_per_unit)
+        stats_path = '{}/{}.stats.json'.format(self.dst_folder, self.base_name)
+        stitch_stats.write_stats(stats, stats_path)
+        inkex.errormsg("{} stitches, {} jumps, {:.0f} mm of thread, about {:.1f} min to stitch. Stats saved to:{}".format(
+            stats['stitch_count'], stats['jump_count'], stats['thread_length_mm'], stats['estimated_run_time_s'] / 60, stats_path))
+
+
+    def visualize_stitches(self, stitches):
+        '''
+        Plots the stitches either in an interactive window or, headless, to an image next to the embroidery file
+        '''
+        if self.preview == PREVIEW_NONE:
+            return
+        import matplotlib
+        if self.preview != PREVIEW_WINDOW:
+            matplotlib.use('Agg') # render without a display so the extension never blocks
+        from matplotlib import pyplot as plt
+        from matplotlib.collections import LineCollection
+
+        #visualize stitches, converted to mm
+        coords = stitches.points / 10
+        num_of_stitches = len(coords)
+        fig, ax = plt.subplots()
+        #Plot the stitches as one collection of line segments
+        if num_of_stitches > 1:
+            ax.add_collection(LineCollection(np.stack([coords[:-1], coords[1:]], axis=1), linewidths=0.5, colors='black'))
+        ax.scatter(coords[:, 0], coords[:, 1], s=1, c='black')
+        ax.autoscale()
+
+        #Label a fixed number of stitches spread evenly over the plan
+        label_indices = np.unique(np.linspace(0, num_of_stitches - 1, min(num_of_stitches, PREVIEW_LABEL_BUDGET)).astype(int))
+        for i in label_indices:
+            ax.annotate(str(i), (coords[i, 0], coords[i, 1]), fontsize=6)
 
         #label axis
-        plt.title("Stitch Vis")
-        plt.xlabel('X Coordinates (mm)')
-        plt.ylabel('Y Coordinates (mm)')
+        ax.set_title("Stitch Vis")
+        ax.set_xlabel('X Coordinates (mm)')
+        ax.set_ylabel('Y Coordinates (mm)')
 
-        #show the plot
-        plt.show()
+        if self.preview == PREVIEW_WINDOW:
+            plt.show()
+        else:
+            extension = 'png' if self.preview == PREVIEW_PNG else 'svg'
+            preview_path = '{}/{}_preview.{}'.format(self.dst_folder, self.base_name, extension)
+            fig.savefig(preview_path, dpi=200)
+            inkex.errormsg("stitch preview saved to:{}".format(preview_path))
+        plt.close(fig)
 
     def run(self):
+        if len(self.formats) == 0:
+            return
         stitch_group = None
-        if self.is_curve:
-            stitch_group = self.stitch_curve()
-        else:
-            stitch_group = self.stitch_segment()
-        self.make_stitches(stitch_group)
+        with profiling.span('generate stitches'):
+            if self.is_curve:
+                stitch_group = self.stitch_curve()
+            else:
+                stitch_group = self.stitch_segment()
+        if self.optimize_order:
+            with profiling.span('order wires'):
+                stitch_group = self.order_wires(stitch_group)
+        with profiling.span('make stitches'):
+            self.make_stitches(stitch_group)
 
 
 
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+import numpy as np
+
+'''
+Converts wire paths into absolute cubic bezier segments using inkex.paths.Path
+Every SVG path command (relative, H/V, quadratics, arcs, ...) is handled by inkex
+Results are cached per element so a wire is only parsed once, up to SEGMENT_CACHE_SIZE wires
+'''
+
+SEGMENT_CACHE_SIZE = 8192 # wires kept parsed, least recently used ones are dropped first
+_segment_cache = OrderedDict() # maps element id to (path data, cubic segments)
+
+def path_to_cubics(path):
+    '''
+    path: inkex.paths.Path
+    returns array of shape (num_segments, 4, 2) holding start, control 1, control 2, end of every segment
+    '''
+    segments = []
+    for subpath in path.to_superpath():
+        for prev, node in zip(subpath[:-1], subpath[1:]):
+            # superpath nodes are [control in, point, control out]
+            segments.append([prev[1], prev[2], node[0], node[1]])
+    return np.asarray(segments, dtype='double').reshape(-1, 4, 2)
+
+
+def get_path_data(elem):
+    '''
+    raw geometry attribute of a path or polyline element
+    '''
+    return elem.get('d', elem.get('points'))
+
+
+def get_cubic_segments(elem):
+    '''
+    Cubic segments of a path or polyline element, parsed once and cached by element id
+    '''
+    path_data = get_path_data(elem)
+    elem_id = elem.get('id')
+    cached = _segment_cache.get(elem_id)
+    if cached is not None and cached[0] == path_data:
+        _segment_cache.move_to_end(elem_id)
+        return cached[1]
+    segments = path_to_cubics(elem.path)
+    if elem_id is not None:
+        _segment_cache[elem_id] = (path_data, segments)
+        _segment_cache.move_to_end(elem_id)
+        if len(_segment_cache) > SEGMENT_CACHE_SIZE:
+            _segment_cache.popitem(last=False)
+    return segments
+
+
+def get_polyline(segments):
+    '''
+    Points joining the segments in order, shape (num_segments + 1, 2)
+    '''
+    if len(segments) == 0:
+        return np.zeros((0, 2))
+    return np.concatenate([segments[:, 0], segments[-1:, 3]])
+
+
+def clear_cache():
+    _segment_cache.clear()
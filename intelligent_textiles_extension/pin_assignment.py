@@ -0,0 +1,131 @@
+import numpy as np
+
+'''
+Assigns wire ends to connector pins
+
+Wire ends and pins are ordered along the axis the wire ends are spread over. Routing the i-th end to a pin
+after the pin of the (i-1)-th end keeps traces from crossing, so among those order preserving assignments
+the one with the shortest total trace length is picked with a dynamic program over the cost matrix.
+Pins of several connectors are pooled, so one selection can route to any number of connectors.
+
+Only numpy is used here so the ink/stitch extensions can import it as well
+'''
+
+def get_cost_matrix(wire_ends, pin_positions):
+    '''
+    wire_ends: array of shape (n, 2)
+    pin_positions: array of shape (m, 2)
+    returns (n, m) array of straight line distances
+    '''
+    wire_ends = np.asarray(wire_ends, dtype='double').reshape(-1, 2)
+    pin_positions = np.asarray(pin_positions, dtype='double').reshape(-1, 2)
+    return np.linalg.norm(wire_ends[:, None, :] - pin_positions[None, :, :], axis=2)
+
+
+def get_sweep_axis(points):
+    '''
+    0 if points are spread wider along x than y, 1 otherwise
+    '''
+    points = np.asarray(points, dtype='double').reshape(-1, 2)
+    if len(points) < 2:
+        return 1
+    spread = points.max(axis=0) - points.min(axis=0)
+    return 0 if spread[0] > spread[1] else 1
+
+
+def assign_in_order(cost):
+    '''
+    cost: (n, m) array with n <= m, rows and columns in sweep order
+    returns array of n strictly increasing column indices minimizing the summed cost
+    '''
+    n, m = cost.shape
+    # best[i, j]: cheapest way to route the first i rows to pins among the first j columns
+    best = np.full((n + 1, m + 1), np.inf)
+    best[0, :] = 0
+    for i in range(1, n + 1):
+        # row i-1 takes column j-1, the rows before it use columns before j-1
+        take = best[i - 1, :-1] + cost[i - 1]
+        best[i, 1:] = np.minimum.accumulate(take)
+
+    columns = np.zeros(n, dtype=int)
+    j = m
+    for i in range(n, 0, -1):
+        # walk back to the column where row i-1's choice was made
+        while best[i, j - 1] == best[i, j]:
+            j -= 1
+        columns[i - 1] = j - 1
+        j -= 1
+    return columns
+
+
+def assign_pins(wire_ends, connector_pins):
+    '''
+    wire_ends: array of shape (n, 2), where each wire leaves for its connector
+    connector_pins: list with one (m_k, 2) array of pin positions per connector
+
+    returns list with a (connector index, pin index) pair for every wire end,
+    or None for the ends that did not get a pin because there are more wire ends than pins
+    '''
+    wire_ends = np.asarray(wire_ends, dtype='double').reshape(-1, 2)
+    pin_arrays = [np.asarray(pins, dtype='double').reshape(-1, 2) for pins in connector_pins]
+    if len(wire_ends) == 0 or sum(len(pins) for pins in pin_arrays) == 0:
+        return [None] * len(wire_ends)
+    pins = np.concatenate(pin_arrays)
+    pin_owners = np.concatenate([np.full(len(p), k) for k, p in enumerate(pin_arrays)])
+    pin_indices = np.concatenate([np.arange(len(p)) for p in pin_arrays])
+
+    axis = get_sweep_axis(wire_ends)
+    wire_order = np.argsort(wire_ends[:, axis], kind='stable')
+    pin_order = np.argsort(pins[:, axis], kind='stable')
+    # wires past the number of pins stay unconnected, as when pins were handed out in order
+    routed_wires = wire_order[:len(pins)]
+    cost = get_cost_matrix(wire_ends[routed_wires], pins[pin_order])
+    columns = assign_in_order(cost)
+
+    assignment = [None] * len(wire_ends)
+    for wire_idx, column in zip(routed_wires, columns):
+        pin = pin_order[column]
+        assignment[wire_idx] = (int(pin_owners[pin]), int(pin_indices[pin]))
+    return assignment
+
+
+class PinSlot():
+    '''
+    Placeholder left in a wire's point list where the points of its pin go
+    '''
+    def __init__(self, index):
+        self.index = index
+
+class DeferredPinAssignment():
+    '''
+    For routing code that reaches connector pins one wire at a time:
+    request() hands out a PinSlot for every wire end, fill() swaps the slots for the points
+    of the pins assigned once every wire end is known
+    '''
+    def __init__(self, connector_pin_points):
+        '''
+        connector_pin_points: list with one (num_pins, points_per_pin, 2) array per connector,
+        wires are routed to the first point of a pin
+        '''
+        self.connector_pin_points = [np.asarray(pins, dtype='double') for pins in connector_pin_points]
+        self.wire_ends = []
+
+    def request(self, wire_end):
+        self.wire_ends.append((float(wire_end[0]), float(wire_end[1])))
+        return PinSlot(len(self.wire_ends) - 1)
+
+    def fill(self, points, format_point):
+        '''
+        points: list of wire points with PinSlots among them
+        format_point: turns an (x, y) pair into a wire point
+        returns points with every slot replaced by the points of its pin, or dropped if no pin was left
+        '''
+        assignment = assign_pins(self.wire_ends, [pins[:, 0] if len(pins) != 0 else np.zeros((0, 2)) for pins in self.connector_pin_points])
+        filled_points = []
+        for p in points:
+            if not isinstance(p, PinSlot):
+                filled_points.append(p)
+            elif assignment[p.index] is not None:
+                connector_idx, pin_idx = assignment[p.index]
+                filled_points.extend(format_point(x, y) for x, y in self.connector_pin_points[connector_idx][pin_idx])
+        return filled_points
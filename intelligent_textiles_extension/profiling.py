@@ -0,0 +1,218 @@
+import contextlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import inkex
+
+'''
+Optional timing and memory spans around the stages of the workers
+
+Profiling is switched on by the .inx "profile" checkbox (json trace), the "profile_memory" checkbox
+or by setting the INTELLIGENT_TEXTILES_PROFILE environment variable to "trace", "cprofile" or "memory".
+Results are written next to the document as <document>.<effect>.trace.json, which loads in
+chrome://tracing or Perfetto, <document>.<effect>.prof for pstats / snakeviz,
+or <document>.<effect>.memory.json with the peak memory and top allocation sites of every stage.
+
+When profiling is off span() hands back a shared do-nothing context manager
+'''
+
+PROFILE_ENV = 'INTELLIGENT_TEXTILES_PROFILE'
+MODE_TRACE = 'trace'
+MODE_CPROFILE = 'cprofile'
+MODE_MEMORY = 'memory'
+MODES = (MODE_TRACE, MODE_CPROFILE, MODE_MEMORY)
+
+TOP_ALLOCATIONS = 10 # allocation sites reported per stage in memory mode
+# allocations made by the profiler itself or the import machinery are left out of the reports
+MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+_mode = None # None while profiling is off
+_start_time = 0.0
+_events = [] # finished spans, as chrome trace events
+_stages = [] # finished spans in memory mode
+_memory_peaks = [] # highest traced memory seen so far by every open memory span, innermost last
+
+class NullSpan():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span():
+    def __init__(self, name):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _events.append({
+            'name': self.name,
+            'ph': 'X', # complete event
+            'ts': (self.start - _start_time) * 1e6, # microseconds
+            'dur': (end - self.start) * 1e6,
+            'pid': os.getpid(),
+            'tid': 0,
+        })
+        return False
+
+
+class MemorySpan():
+    '''
+    Records the peak traced memory while the stage runs and the allocation sites that grew the most over it
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.depth = 0
+        self.index = 0
+        self.start_bytes = 0
+        self.snapshot = None
+
+    def __enter__(self):
+        current, peak = tracemalloc.get_traced_memory()
+        if len(_memory_peaks) != 0: # hand the enclosing stage its peak so far before resetting
+            _memory_peaks[-1] = max(_memory_peaks[-1], peak)
+        if hasattr(tracemalloc, 'reset_peak'): # python 3.9+, older versions report the peak since tracing started
+            tracemalloc.reset_peak()
+        self.depth = len(_memory_peaks)
+        self.index = len(_stages) # stages are reported in the order they start
+        _stages.append(None)
+        self.start_bytes = current
+        _memory_peaks.append(current)
+        self.snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        return self
+
+    def __exit__(self, *exc):
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(_memory_peaks.pop(), peak)
+        if len(_memory_peaks) != 0:
+            _memory_peaks[-1] = max(_memory_peaks[-1], peak)
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        top_stats = snapshot.compare_to(self.snapshot, 'lineno')[:TOP_ALLOCATIONS]
+        self.snapshot = None
+        _stages[self.index] = {
+            'name': self.name,
+            'depth': self.depth,
+            'start_bytes': self.start_bytes,
+            'end_bytes': current,
+            'peak_bytes': peak,
+            'top_allocations': [{
+                'site': '{}:{}'.format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                'size_diff_bytes': stat.size_diff,
+                'count_diff': stat.count_diff,
+                'size_bytes': stat.size,
+            } for stat in top_stats],
+        }
+        return False
+
+
+def span(name):
+    '''
+    with profiling.span("stage name"): ...
+    '''
+    if _mode is None or _mode == MODE_CPROFILE:
+        return NULL_SPAN
+    if _mode == MODE_MEMORY:
+        return MemorySpan(name)
+    return Span(name)
+
+
+def get_mode(enabled=False, memory=False):
+    '''
+    enabled: value of the .inx profile checkbox, turns on the json trace
+    memory: value of the .inx profile_memory checkbox, turns on memory mode
+    the environment variable wins over the checkboxes
+    '''
+    mode = os.environ.get(PROFILE_ENV, '').strip().lower()
+    if mode in MODES:
+        return mode
+    if memory:
+        return MODE_MEMORY
+    return MODE_TRACE if enabled else None
+
+
+def get_output_path(document_path, effect_name, extension):
+    '''
+    <document folder>/<document name>.<effect_name>.<extension>, in the temp folder for unsaved documents
+    '''
+    if document_path:
+        folder = os.path.dirname(os.path.abspath(document_path))
+        name = os.path.splitext(os.path.basename(document_path))[0]
+    else:
+        folder = tempfile.gettempdir()
+        name = 'untitled'
+    return os.path.join(folder, '{}.{}.{}'.format(name, effect_name, extension))
+
+
+def summarize(events):
+    '''
+    returns dict mapping span name to its call count and total seconds
+    '''
+    summary = {}
+    for event in events:
+        entry = summary.setdefault(event['name'], {'count': 0, 'total_s': 0.0})
+        entry['count'] += 1
+        entry['total_s'] += event['dur'] / 1e6
+    return summary
+
+
+@contextlib.contextmanager
+def session(mode, document_path, effect_name):
+    '''
+    Records every span (or the cProfile stats) of the code run inside it and writes them out at the end
+    mode: result of get_mode, None does nothing
+    '''
+    global _mode, _start_time
+    if mode is None:
+        yield
+        return
+    _mode = mode
+    _start_time = time.perf_counter()
+    _events.clear()
+    _stages.clear()
+    profiler = None
+    started_tracing = False
+    if mode == MODE_CPROFILE:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif mode == MODE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    try:
+        with span(effect_name):
+            yield
+    finally:
+        _mode = None
+        if profiler is not None:
+            profiler.disable()
+            output_path = get_output_path(document_path, effect_name, 'prof')
+            profiler.dump_stats(output_path)
+        elif mode == MODE_MEMORY:
+            if started_tracing:
+                tracemalloc.stop()
+            output_path = get_output_path(document_path, effect_name, 'memory.json')
+            with open(output_path, 'w') as f:
+                json.dump({'stages': _stages}, f, indent=1)
+            for stage in _stages:
+                inkex.errormsg("{}{}: peak {:.1f} MB, {:+.1f} MB".format('  ' * stage['depth'], stage['name'],
+                               stage['peak_bytes'] / 1e6, (stage['end_bytes'] - stage['start_bytes']) / 1e6))
+        else:
+            output_path = get_output_path(document_path, effect_name, 'trace.json')
+            with open(output_path, 'w') as f:
+                json.dump({'traceEvents': _events, 'summary': summarize(_events)}, f, indent=1)
+        inkex.errormsg("profile saved to:{}".format(output_path))
@@ -0,0 +1,157 @@
+import numpy as np
+import bezier_util
+import path_flattener
+
+'''
+Places stitches along wires at a target stitch length by walking them by arc length
+Every vertex of a wire (every segment end) is kept as a stitch so corners are sewn as drawn,
+the pieces between vertices are resampled on their own.
+All pieces of all wires are processed together as one concatenated array
+'''
+
+FLATTEN_STEPS = 16 # points sampled per bezier segment before resampling by arc length
+# part of every stitch cache key, bump whenever the stitches placed here or by bezier_util change
+ALGORITHM_VERSION = 3
+
+def get_stitch_counts(wire_lengths, stitch_length, min_stitch_length, max_stitch_length):
+    '''
+    Number of stitches for each wire so that every stitch is as close to stitch_length
+    as possible while staying within [min_stitch_length, max_stitch_length]
+    '''
+    counts = np.maximum(1, np.round(wire_lengths / stitch_length))
+    counts = np.where(wire_lengths / counts > max_stitch_length, np.ceil(wire_lengths / max_stitch_length), counts)
+    counts = np.where((wire_lengths / counts < min_stitch_length) & (counts > 1),
+                      np.maximum(1, np.floor(wire_lengths / min_stitch_length)), counts)
+    return counts.astype(int)
+
+
+def place_stitches(points, cum_lengths, starts, ends, counts):
+    '''
+    points: array of shape (n, 2) holding the polylines of every piece
+    cum_lengths: arc length from the first point to every point
+    starts, ends: index of the first and last point of every piece in points
+    counts: number of stitches of every piece
+    returns array of shape (sum(counts), 2), every piece's stitches evenly spaced by arc length,
+    starting on its first point and stopping one stitch short of its last
+    '''
+    piece_lengths = cum_lengths[ends] - cum_lengths[starts]
+
+    # distance along the concatenated points of every stitch, start + k * length / count for k in 0..count-1
+    piece_of_target = np.repeat(np.arange(len(starts)), counts)
+    target_offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    steps = np.divide(piece_lengths, counts, out=np.zeros_like(piece_lengths), where=counts > 0)
+    targets = cum_lengths[starts][piece_of_target] + target_offsets * steps[piece_of_target]
+
+    # find the segment each target falls on and interpolate along it
+    seg_idx = np.searchsorted(cum_lengths, targets, side='right') - 1
+    seg_idx = np.clip(seg_idx, starts[piece_of_target], ends[piece_of_target] - 1)
+    seg_lengths = cum_lengths[seg_idx + 1] - cum_lengths[seg_idx]
+    frac = np.divide(targets - cum_lengths[seg_idx], seg_lengths, out=np.zeros_like(targets), where=seg_lengths > 0)
+    frac = np.clip(frac, 0, 1)
+    return points[seg_idx] + (points[seg_idx + 1] - points[seg_idx]) * frac[:, None]
+
+
+def resample_pieces(points, starts, ends, pieces_per_wire, wire_ends, stitch_length, min_stitch_length, max_stitch_length,
+                    piece_lengths=None):
+    '''
+    points, starts, ends: pieces as in place_stitches, ordered by wire
+    pieces_per_wire: number of pieces of every wire
+    wire_ends: array of shape (num_wires, 2), the last point of every wire
+    piece_lengths: exact length of every piece to count stitches from, defaults to the length of its points
+    returns list of stitch point arrays, one per wire, holding the first point of every piece and the wire's last point
+    '''
+    cum_lengths = np.concatenate([[0], np.cumsum(np.linalg.norm(np.diff(points, axis=0), axis=1))])
+    if piece_lengths is None:
+        piece_lengths = cum_lengths[ends] - cum_lengths[starts]
+    counts = get_stitch_counts(piece_lengths, stitch_length, min_stitch_length, max_stitch_length)
+    counts[piece_lengths == 0] = 0 # repeated points add no stitch
+    stitches = place_stitches(points, cum_lengths, starts, ends, counts)
+
+    # stitches of every wire, from the cumulative stitch count at its first and last piece
+    piece_bounds = np.concatenate([[0], np.cumsum(pieces_per_wire)])
+    stitch_bounds = np.concatenate([[0], np.cumsum(counts)])[piece_bounds]
+    return [np.concatenate([stitches[first:last], wire_ends[i:i + 1]])
+            for i, (first, last) in enumerate(zip(stitch_bounds[:-1], stitch_bounds[1:]))]
+
+
+def resample_polylines(polylines, stitch_length, min_stitch_length, max_stitch_length):
+    '''
+    polylines: list of arrays of shape (n, 2), one per wire
+    returns list of stitch point arrays, one per wire, keeping every vertex of the polyline
+    '''
+    polylines = [np.asarray(w, dtype='double').reshape(-1, 2) for w in polylines]
+    results = [np.zeros((0, 2)) for _ in polylines]
+    usable = [i for i, w in enumerate(polylines) if len(w) != 0]
+    if len(usable) == 0:
+        return results
+    points = np.concatenate([polylines[i] for i in usable])
+    sizes = np.array([len(polylines[i]) for i in usable])
+    wire_starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    # every segment between two vertices of a wire is a piece
+    is_piece_start = np.ones(len(points), dtype=bool)
+    is_piece_start[wire_starts + sizes - 1] = False
+    starts = np.flatnonzero(is_piece_start)
+    wire_ends = points[wire_starts + sizes - 1]
+    wire_stitches = resample_pieces(points, starts, starts + 1, sizes - 1, wire_ends,
+                                    stitch_length, min_stitch_length, max_stitch_length)
+    for i, stitches in zip(usable, wire_stitches):
+        results[i] = stitches
+    return results
+
+
+def resample_curves(wire_segments, stitch_length, min_stitch_length, max_stitch_length, steps=FLATTEN_STEPS):
+    '''
+    wire_segments: list of cubic segment arrays of shape (num_segments, 4, 2), one per wire
+    returns list of stitch point arrays, one per wire, keeping the end points of every segment
+    every segment of every wire is sampled densely in one batch and each segment is resampled by arc length,
+    with its stitch count taken from its exact arc length
+    '''
+    wire_segments = [np.asarray(w, dtype='double').reshape(-1, 4, 2) for w in wire_segments]
+    results = [np.zeros((0, 2)) for _ in wire_segments]
+    usable = [i for i, w in enumerate(wire_segments) if len(w) != 0]
+    if len(usable) == 0:
+        return results
+    segments = np.concatenate([wire_segments[i] for i in usable])
+    # every segment is a piece of steps + 1 points
+    points = bezier_util.evaluate(segments, np.linspace(0, 1, steps + 1)).reshape(-1, 2)
+    starts = np.arange(len(segments)) * (steps + 1)
+    wire_ends = np.array([wire_segments[i][-1, 3] for i in usable])
+    wire_stitches = resample_pieces(points, starts, starts + steps, np.array([len(wire_segments[i]) for i in usable]), wire_ends,
+                                    stitch_length, min_stitch_length, max_stitch_length,
+                                    piece_lengths=bezier_util.arc_lengths(segments))
+    for i, stitches in zip(usable, wire_stitches):
+        results[i] = stitches
+    return results
+
+
+def stitch_wires(wire_segments, is_curve, stitch_length, min_stitch_length, max_stitch_length):
+    '''
+    wire_segments: list of cubic segment arrays, one per wire
+    returns list of stitch point arrays, one per wire
+    '''
+    if is_curve:
+        return resample_curves(wire_segments, stitch_length, min_stitch_length, max_stitch_length)
+    polylines = [path_flattener.get_polyline(segments) for segments in wire_segments]
+    return resample_polylines(polylines, stitch_length, min_stitch_length, max_stitch_length)
+
+
+def pack_wires(wires):
+    '''
+    Packs per wire stitch arrays into one float64 array and the number of stitches in each wire,
+    which is much cheaper to send between processes than a list of arrays
+    '''
+    sizes = np.array([len(w) for w in wires], dtype=np.int64)
+    if sizes.sum() == 0:
+        return np.zeros((0, 2), dtype='double'), sizes
+    return np.concatenate(wires).astype('double', copy=False), sizes
+
+
+def unpack_wires(points, sizes):
+    return np.split(points, np.cumsum(sizes)[:-1])
+
+
+def stitch_wires_packed(args):
+    '''
+    Process pool entry point, args are the arguments to stitch_wires
+    '''
+    return pack_wires(stitch_wires(*args))
@@ -0,0 +1,161 @@
+import math
+import wire_util
+
+'''
+Uniform grid spatial index over wire segments, used to find wires that run
+too close to each other without comparing every pair of segments
+'''
+class SegmentIndex():
+    def __init__(self, min_distance):
+        '''
+        min_distance: the spacing queries will be made against. Cells are twice
+        that size so any segment within min_distance of a query lies in one of
+        the 3x3 cells around a cell the query passes through
+        '''
+        self.min_distance = min_distance
+        self.cell_size = 2 * min_distance
+        self.cells = {} # maps (col, row) to list of segment indices
+        self.segments = [] # list of (start, end, owner)
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def _cells_along(self, a, b):
+        '''
+        cells covered by segment a-b, sampled every quarter cell so no cell
+        the segment crosses is skipped
+        '''
+        length = wire_util.compute_euclidean_distance(a[0], a[1], b[0], b[1])
+        num_steps = max(1, int(math.ceil(length / (self.cell_size / 4))))
+        cells = set()
+        for i in range(num_steps + 1):
+            t = i / num_steps
+            cells.add(self._cell(a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t))
+        return cells
+
+    def insert_segment(self, a, b, owner):
+        idx = len(self.segments)
+        self.segments.append((a, b, owner))
+        for cell in self._cells_along(a, b):
+            self.cells.setdefault(cell, []).append(idx)
+
+    def insert_wire(self, points, owner):
+        '''
+        points: list of (x, y) points making up a wire, in order
+        owner: identifier returned when this wire is hit by a query (usually the element id)
+        '''
+        for i in range(len(points) - 1):
+            self.insert_segment(points[i], points[i+1], owner)
+
+    def query_segment(self, a, b):
+        '''
+        returns set of owners with a segment closer than min_distance to segment a-b
+        '''
+        candidates = set()
+        for col, row in self._cells_along(a, b):
+            for d_col in (-1, 0, 1):
+                for d_row in (-1, 0, 1):
+                    candidates.update(self.cells.get((col + d_col, row + d_row), []))
+        hits = set()
+        for idx in candidates:
+            c, d, owner = self.segments[idx]
+            if owner in hits:
+                continue
+            if wire_util.segment_distance(a, b, c, d) < self.min_distance:
+                hits.add(owner)
+        return hits
+
+    def query_wire(self, points):
+        '''
+        returns set of owners with a segment closer than min_distance to any segment of the wire
+        '''
+        hits = set()
+        for i in range(len(points) - 1):
+            hits.update(self.query_segment(points[i], points[i+1]))
+        return hits
+
+
+'''
+Uniform grid spatial index over points that supports removal,
+used for nearest neighbour lookups between wire end points
+'''
+class PointIndex():
+    def __init__(self, points, cell_size=None):
+        '''
+        points: list of (x, y)
+        cell_size: defaults to a size that puts about one point in every cell
+        '''
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.alive = [True] * len(self.points)
+        self.num_alive = len(self.points)
+        if cell_size is None:
+            cell_size = self.default_cell_size()
+        self.cell_size = cell_size
+        self.cells = {} # maps (col, row) to indices of points still in the index
+        for idx, (x, y) in enumerate(self.points):
+            self.cells.setdefault(self._cell(x, y), []).append(idx)
+        cells = list(self.cells.keys())
+        self.col_range = (min(c for c, _ in cells), max(c for c, _ in cells)) if cells else (0, 0)
+        self.row_range = (min(r for _, r in cells), max(r for _, r in cells)) if cells else (0, 0)
+
+    def default_cell_size(self):
+        if len(self.points) < 2:
+            return 1.0
+        xs = [p[0] for p in self.points]
+        ys = [p[1] for p in self.points]
+        width, height = max(xs) - min(xs), max(ys) - min(ys)
+        if max(width, height) == 0:
+            return 1.0
+        # points along a line have no area, spread them over about one cell each along its length instead
+        return max(math.sqrt(width * height / len(self.points)), max(width, height) / len(self.points))
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def remove(self, idx):
+        if self.alive[idx]:
+            self.alive[idx] = False
+            self.num_alive -= 1
+            self.cells[self._cell(*self.points[idx])].remove(idx)
+
+    def _ring(self, col, row, radius):
+        if radius == 0:
+            yield (col, row)
+            return
+        for d in range(-radius, radius + 1):
+            yield (col + d, row - radius)
+            yield (col + d, row + radius)
+        for d in range(-radius + 1, radius):
+            yield (col - radius, row + d)
+            yield (col + radius, row + d)
+
+    def k_nearest(self, x, y, k, exclude=None):
+        '''
+        returns list of (distance, idx) for the k closest points still in the index, closest first
+        exclude: optional set of indices to skip
+        '''
+        col, row = self._cell(x, y)
+        # ring beyond which there are no cells with points
+        max_radius = max(abs(col - self.col_range[0]), abs(col - self.col_range[1]),
+                         abs(row - self.row_range[0]), abs(row - self.row_range[1]))
+        found = []
+        for radius in range(max_radius + 1):
+            for cell in self._ring(col, row, radius):
+                for idx in self.cells.get(cell, []):
+                    if exclude is None or idx not in exclude:
+                        px, py = self.points[idx]
+                        found.append((math.hypot(px - x, py - y), idx))
+            # every point outside the rings searched so far is at least radius * cell_size away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= radius * self.cell_size:
+                    break
+        found.sort()
+        return found[:k]
+
+    def nearest(self, x, y):
+        '''
+        returns (distance, idx) of the closest point still in the index, or (None, None) if it is empty
+        '''
+        found = self.k_nearest(x, y, 1)
+        return found[0] if len(found) != 0 else (None, None)
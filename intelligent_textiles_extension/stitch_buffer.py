@@ -0,0 +1,58 @@
+import numpy as np
+
+'''
+Growable (N, 3) array of stitches holding x, y and the pyembroidery command of every stitch
+'''
+
+STITCH = 0 # same values as pyembroidery.STITCH and pyembroidery.JUMP
+JUMP = 1
+PATTERN_UNITS_PER_MM = 10 # pyembroidery patterns are in 1/10 mm
+
+class StitchBuffer():
+    def __init__(self, capacity=1024):
+        self.data = np.zeros((max(capacity, 1), 3), dtype='double')
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, num_stitches):
+        '''
+        makes sure num_stitches more stitches fit without reallocating
+        '''
+        needed = self.size + num_stitches
+        if needed > len(self.data):
+            new_data = np.zeros((max(needed, 2 * len(self.data)), 3), dtype='double')
+            new_data[:self.size] = self.data[:self.size]
+            self.data = new_data
+
+    def append(self, points, command=STITCH):
+        '''
+        points: array of shape (n, 2), all added with the same command
+        '''
+        points = np.asarray(points, dtype='double').reshape(-1, 2)
+        self.reserve(len(points))
+        self.data[self.size:self.size + len(points), :2] = points
+        self.data[self.size:self.size + len(points), 2] = command
+        self.size += len(points)
+
+    @property
+    def array(self):
+        return self.data[:self.size]
+
+    @property
+    def points(self):
+        return self.data[:self.size, :2]
+
+    @property
+    def commands(self):
+        return self.data[:self.size, 2].astype(int)
+
+    def to_pattern(self, pattern):
+        '''
+        Adds every stitch to a pyembroidery.EmbPattern in one go
+        '''
+        xy = self.points.tolist()
+        commands = self.commands.tolist()
+        pattern.stitches.extend([[x, y, c] for (x, y), c in zip(xy, commands)])
+        return pattern
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import sys
+import time
+import numpy as np
+import db_connections
+
+
+
+'''
+On disk cache of per wire stitch arrays, keyed by a hash of the wire's geometry and stitch settings
+Least recently used entries are evicted once the cache grows past max_bytes
+The cache lives in the user's cache directory so it is shared by every document and working directory
+'''
+
+CACHE_DIR_ENV = 'INTELLIGENT_TEXTILES_CACHE_DIR'
+CACHE_FORMAT_VERSION = 1 # bump when the stored blobs change layout, entries of older versions are never read
+
+def get_cache_dir():
+    '''
+    per user cache directory for the extension, the INTELLIGENT_TEXTILES_CACHE_DIR environment variable wins
+    '''
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        if os.name == 'nt':
+            base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        elif sys.platform == 'darwin':
+            base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+        else:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(base, 'intelligent_textiles')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+class StitchCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, stitch_db=None):
+        self.stitch_db = stitch_db if stitch_db is not None else os.path.join(get_cache_dir(), "stitch_cache")
+        self.max_bytes = max_bytes
+        self.init_stitch_cache_database()
+
+    def connect(self):
+        return db_connections.connect(self.stitch_db)
+
+    def close(self, conn):
+        db_connections.close(conn)
+
+    def init_stitch_cache_database(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stitch_cache_table
+        (key text PRIMARY KEY, stitches blob, size integer, last_used real);''')
+        conn.commit()
+        self.close(conn)
+
+    @staticmethod
+    def make_key(path_data, *stitch_params):
+        '''
+        path_data: the wire's path data string
+        stitch_params: anything else that changes the stitches (algorithm version, wire type, stitch lengths, ...)
+        '''
+        key_str = '|'.join([repr(CACHE_FORMAT_VERSION), path_data or ''] + [repr(p) for p in stitch_params])
+        return hashlib.sha1(key_str.encode('utf-8')).hexdigest()
+
+    def retrieve_stitches(self, keys):
+        '''
+        returns dict mapping every cached key in keys to its (n, 2) stitch array
+        '''
+        unique_keys = list(set(keys))
+        found = {}
+        conn = self.connect()
+        cursor = conn.cursor()
+        for i in range(0, len(unique_keys), 500): # stay under sqlite's limit on query parameters
+            batch = unique_keys[i:i + 500]
+            result = cursor.execute('''
+            SELECT key, stitches FROM stitch_cache_table WHERE key IN ({});'''.format(','.join('?' * len(batch))), batch).fetchall()
+            for key, blob in result:
+                found[key] = np.frombuffer(blob, dtype='double').reshape(-1, 2).copy()
+        now = time.time()
+        cursor.executemany('''
+        UPDATE stitch_cache_table SET last_used = ? WHERE key = ?;''', [(now, key) for key in found])
+        conn.commit()
+        self.close(conn)
+        return found
+
+    def insert_stitches(self, key_to_stitches):
+        '''
+        key_to_stitches: dict mapping key to (n, 2) stitch array
+        '''
+        now = time.time()
+        rows = []
+        for key, stitches in key_to_stitches.items():
+            blob = np.ascontiguousarray(stitches, dtype='double').tobytes()
+            rows.append((key, blob, len(blob), now))
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.executemany('''
+        INSERT OR REPLACE INTO stitch_cache_table VALUES (?, ?, ?, ?);''', rows)
+        conn.commit()
+        self.evict(cursor)
+        conn.commit()
+        self.close(conn)
+
+    def evict(self, cursor):
+        '''
+        Deletes least recently used entries until the cache fits in max_bytes
+        '''
+        total = cursor.execute('''SELECT COALESCE(SUM(size), 0) FROM stitch_cache_table''').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        result = cursor.execute('''SELECT key, size FROM stitch_cache_table ORDER BY last_used ASC''').fetchall()
+        stale_keys = []
+        for key, size in result:
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        cursor.executemany('''DELETE FROM stitch_cache_table WHERE key = ?''', stale_keys)
+
+    def clear(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''DELETE FROM stitch_cache_table''')
+        conn.commit()
+        self.close(conn)
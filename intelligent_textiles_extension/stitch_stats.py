@@ -0,0 +1,49 @@
+import json
+import numpy as np
+from stitch_buffer import STITCH, JUMP, PATTERN_UNITS_PER_MM
+import wire_order
+
+'''
+Production statistics for a stitch plan, computed straight from the stitch array
+'''
+
+NUM_HISTOGRAM_BINS = 20
+
+def compute_stats(stitch_array, stitches_per_minute, max_jump_length_mm, num_bins=NUM_HISTOGRAM_BINS):
+    '''
+    stitch_array: array of shape (n, 3) holding x, y and command in pattern units, e.g. StitchBuffer.array
+    max_jump_length_mm: longest move the machine makes in one jump stitch, the histogram spans up to it
+    returns dict of stats, lengths in mm and times in seconds
+    '''
+    stitch_array = np.asarray(stitch_array, dtype='double').reshape(-1, 3)
+    commands = stitch_array[:, 2].astype(int)
+    # a stitch's length is the distance from the previous needle position
+    lengths = np.linalg.norm(np.diff(stitch_array[:, :2], axis=0), axis=1) / PATTERN_UNITS_PER_MM
+    stitch_lengths = lengths[commands[1:] == STITCH]
+    jump_lengths = lengths[commands[1:] == JUMP] # travel between wires, not thread
+    num_stitches = int(np.count_nonzero(commands == STITCH))
+    if len(stitch_lengths) != 0:
+        # fixed range from 0, stitches of a straight grid differ only by rounding and would not span num_bins
+        counts, bin_edges = np.histogram(stitch_lengths, bins=num_bins, range=(0, max(stitch_lengths.max(), max_jump_length_mm)))
+    else:
+        counts, bin_edges = np.zeros(0, dtype=int), np.zeros(0)
+    return {
+        'stitch_count': num_stitches,
+        'jump_count': int(np.count_nonzero(commands == JUMP)),
+        'thread_length_mm': float(stitch_lengths.sum()),
+        'jump_length_mm': float(jump_lengths.sum()),
+        'longest_stitch_mm': float(stitch_lengths.max()) if len(stitch_lengths) != 0 else 0.0,
+        'mean_stitch_mm': float(stitch_lengths.mean()) if len(stitch_lengths) != 0 else 0.0,
+        'stitches_per_minute': stitches_per_minute,
+        'estimated_run_time_s': 60.0 * num_stitches / stitches_per_minute
+                                + wire_order.estimate_jump_time(jump_lengths, max_jump_length_mm, stitches_per_minute),
+        'stitch_length_histogram': {
+            'bin_edges_mm': bin_edges.tolist(),
+            'counts': counts.tolist(),
+        },
+    }
+
+
+def write_stats(stats, path):
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
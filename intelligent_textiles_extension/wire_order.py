@@ -0,0 +1,136 @@
+import math
+import numpy as np
+from spatial_index import PointIndex
+
+'''
+Chooses the order and direction wires are stitched in to keep jumps between wires short
+Each wire is stitched start to end unless it is flipped, and the machine jumps from
+the last stitch of one wire to the first stitch of the next
+'''
+
+NUM_NEIGHBOURS = 8 # candidate end points considered for every 2-opt move
+MAX_TWO_OPT_PASSES = 10
+
+def get_jump_lengths(wires):
+    '''
+    wires: list of stitch point arrays in the order they are stitched
+    returns the length of every jump between consecutive wires
+    '''
+    ends = np.array([w[-1] for w in wires[:-1]], dtype='double').reshape(-1, 2)
+    starts = np.array([w[0] for w in wires[1:]], dtype='double').reshape(-1, 2)
+    return np.linalg.norm(starts - ends, axis=1)
+
+
+def estimate_jump_time(jump_lengths, max_jump_length, stitches_per_minute):
+    '''
+    Seconds the machine spends on jumps, long jumps are split into several jump stitches
+    '''
+    jump_lengths = np.asarray(jump_lengths, dtype='double')
+    num_jump_stitches = np.ceil(jump_lengths[jump_lengths > 0] / max_jump_length).sum()
+    return 60 * num_jump_stitches / stitches_per_minute
+
+
+class WireOrderOptimizer():
+    def __init__(self, wires):
+        '''
+        wires: list of stitch point arrays, each with at least one point
+        '''
+        self.wires = wires
+        self.starts = [tuple(w[0]) for w in wires]
+        self.ends = [tuple(w[-1]) for w in wires]
+        # end point 2 * i is the start of wire i, 2 * i + 1 its end
+        self.endpoint_index = PointIndex([p for i in range(len(wires)) for p in (self.starts[i], self.ends[i])])
+        self.order = []
+        self.flipped = []
+        self.positions = []
+
+    def entry(self, pos):
+        w = self.order[pos]
+        return self.ends[w] if self.flipped[pos] else self.starts[w]
+
+    def exit(self, pos):
+        w = self.order[pos]
+        return self.starts[w] if self.flipped[pos] else self.ends[w]
+
+    def nearest_neighbour_tour(self):
+        '''
+        Starts from the first wire and repeatedly jumps to the closest end point of a wire not yet stitched
+        '''
+        if len(self.wires) == 0:
+            return
+        current = 0
+        is_flipped = False
+        while current is not None:
+            self.order.append(current)
+            self.flipped.append(is_flipped)
+            self.endpoint_index.remove(2 * current)
+            self.endpoint_index.remove(2 * current + 1)
+            x, y = self.exit(len(self.order) - 1)
+            _, endpoint = self.endpoint_index.nearest(x, y)
+            if endpoint is None:
+                current = None
+            else:
+                current = endpoint // 2
+                is_flipped = endpoint % 2 == 1 # entering a wire at its end means stitching it backwards
+        self.positions = [0] * len(self.wires)
+        for pos, w in enumerate(self.order):
+            self.positions[w] = pos
+
+    def jump(self, p1, p2):
+        return math.hypot(p1[0] - p2[0], p1[1] - p2[1])
+
+    def two_opt_gain(self, i, j):
+        '''
+        gain of reversing the tour between positions i + 1 and j (inclusive)
+        reversing also flips every wire in between, so only the two jumps at the ends of the range change
+        i = -1 reverses the start of the tour, which has no jump before it
+        '''
+        last = len(self.order) - 1
+        old = new = 0
+        if i >= 0:
+            old += self.jump(self.exit(i), self.entry(i + 1))
+            new += self.jump(self.exit(i), self.exit(j))
+        if j < last:
+            old += self.jump(self.exit(j), self.entry(j + 1))
+            new += self.jump(self.entry(i + 1), self.entry(j + 1))
+        return old - new
+
+    def reverse(self, i, j):
+        self.order[i + 1:j + 1] = self.order[i + 1:j + 1][::-1]
+        self.flipped[i + 1:j + 1] = [not f for f in self.flipped[i + 1:j + 1][::-1]]
+        for pos in range(i + 1, j + 1):
+            self.positions[self.order[pos]] = pos
+
+    def two_opt(self):
+        '''
+        Improves the tour with 2-opt moves, only trying to connect each wire
+        to the wires whose end points are among its closest neighbours
+        Position -1 stands for the start of the tour, so the first wire can be moved and flipped as well
+        '''
+        all_endpoints = PointIndex(self.endpoint_index.points, self.endpoint_index.cell_size)
+        for _ in range(MAX_TWO_OPT_PASSES):
+            improved = False
+            for i in range(-1, len(self.order) - 1):
+                # a reversed start of the tour is left from the current first entry point
+                x, y = self.exit(i) if i >= 0 else self.entry(0)
+                w = self.order[max(i, 0)]
+                own = {2 * w, 2 * w + 1}
+                for _, endpoint in all_endpoints.k_nearest(x, y, NUM_NEIGHBOURS, exclude=own):
+                    pos = self.positions[endpoint // 2]
+                    # try making this end point the one reached from position i, both as the exit
+                    # of the reversed range and as the entry into the range after it
+                    for j in (pos, pos - 1):
+                        if j > i and self.two_opt_gain(i, j) > 1e-9:
+                            self.reverse(i, j)
+                            improved = True
+                            break
+            if not improved:
+                break
+
+    def optimize(self):
+        '''
+        returns the wires reordered and flipped to minimize the total jump distance
+        '''
+        self.nearest_neighbour_tour()
+        self.two_opt()
+        return [self.wires[w][::-1] if f else self.wires[w] for w, f in zip(self.order, self.flipped)]
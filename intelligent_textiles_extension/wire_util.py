@@ -1,27 +1,80 @@
 import inkex
-from lxml import etree
 import math
+import numpy as np
 
-def create_path(svg, points, is_horizontal):
+WIRE_ID_PREFIXES = {True: 'wire-h', False: 'wire-v'} # keyed by is_horizontal
+
+def is_generated_wire_id(elem_id):
+    '''
+    True for the wire ids IdAllocator hands out
+    '''
+    return elem_id is not None and elem_id.startswith(tuple(prefix + '-' for prefix in WIRE_ID_PREFIXES.values()))
+
+
+class IdAllocator():
+    '''
+    Hands out readable ids that are unique in the document, e.g. wire-h-0001
+    The ids already in the document are read once, instead of once for every new element
+    '''
+    def __init__(self, svg):
+        self.used_ids = set(svg.xpath('//@id'))
+        self.counters = {} # maps prefix to the last number handed out
+
+    def next_id(self, prefix):
+        count = self.counters.get(prefix, 0)
+        new_id = None
+        while new_id is None or new_id in self.used_ids:
+            count += 1
+            new_id = '{}-{:04d}'.format(prefix, count)
+        self.counters[prefix] = count
+        self.used_ids.add(new_id)
+        return new_id
+
+
+WIRE_STYLE = "stroke: %s; stroke-width: 0.4; fill: none; stroke-dasharray:0.4,0.4"
+PATH_PRECISION = 4 # decimals written for every coordinate
+PATH_TAG = inkex.addNS('path', 'svg')
+
+def format_path_data(points, precision=PATH_PRECISION):
+    '''
+    points: array of shape (n, 2)
+    returns path data 'M x,y L x,y ...' with every coordinate written with precision decimals
+    '''
+    points = np.asarray(points, dtype='double').reshape(-1, 2)
+    if len(points) == 0:
+        return ''
+    point_format = '%.{0}f,%.{0}f'.format(precision)
+    return ('M ' + point_format + (' L ' + point_format) * (len(points) - 1)) % tuple(points.ravel())
+
+
+def create_paths(svg, wires, is_horizontal, id_allocator=None, precision=PATH_PRECISION):
+    '''
+    Appends one wire segment path per list of points to the current layer in one go
+    wires: list of arrays of shape (n, 2), the points of every wire in order
+    id_allocator: IdAllocator naming the wires, without one inkex picks a random id when asked for it
+    returns list of the new elements
+    '''
+    layer = svg.get_current_layer()
+    style = WIRE_STYLE % ("red" if is_horizontal else "blue")
+    elems = []
+    for points in wires:
+        line_attribs = {
+            'style': style,
+            'd': format_path_data(points, precision),
+        }
+        if id_allocator is not None:
+            line_attribs['id'] = id_allocator.next_id(WIRE_ID_PREFIXES[is_horizontal])
+        elems.append(layer.makeelement(PATH_TAG, line_attribs))
+    layer.extend(elems)
+    return elems
+
+
+def create_path(svg, points, is_horizontal, id_allocator=None, precision=PATH_PRECISION):
     '''
     Creates a wire segment path given all of the points sequentially
+    points: array of shape (n, 2)
     '''
-    
-    color = "red" if is_horizontal else "blue"
-    path_str = ' '.join(points)
-    path = inkex.Polyline(attrib={
-    'id': "wire_segment",
-    'points': path_str,
-    })
-
-    line_attribs = {
-            'style' : "stroke: %s; stroke-width: 0.4; fill: none; stroke-dasharray:0.4,0.4" % color,
-            'd': str(path.get_path())
-            # 'points': 'M 0,0 9,9 5,5'
-    }
-    
-    elem = etree.SubElement(svg.get_current_layer(), inkex.addNS('path','svg'), line_attribs)  
-    return elem
+    return create_paths(svg, [points], is_horizontal, id_allocator, precision)[0]
 
 
 def compute_euclidean_distance(x1, y1, x2, y2):
@@ -46,3 +99,47 @@ def segment_line(line, num_points):
         points.append([x,y])
     return points
 
+
+
+def point_segment_distance(p, a, b):
+    '''
+    Shortest distance from point p to the segment a-b
+    '''
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return compute_euclidean_distance(p[0], p[1], a[0], a[1])
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length_sq
+    t = max(0, min(1, t))
+    return compute_euclidean_distance(p[0], p[1], a[0] + t * dx, a[1] + t * dy)
+
+
+def segments_intersect(a1, a2, b1, b2):
+    '''
+    True if segment a1-a2 crosses or touches segment b1-b2
+    '''
+    def orientation(p, q, r):
+        val = (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+        return 0 if val == 0 else (1 if val > 0 else -1)
+
+    def on_segment(p, q, r):
+        return min(p[0], r[0]) <= q[0] <= max(p[0], r[0]) and min(p[1], r[1]) <= q[1] <= max(p[1], r[1])
+
+    o1 = orientation(a1, a2, b1)
+    o2 = orientation(a1, a2, b2)
+    o3 = orientation(b1, b2, a1)
+    o4 = orientation(b1, b2, a2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return (o1 == 0 and on_segment(a1, b1, a2)) or (o2 == 0 and on_segment(a1, b2, a2)) \
+        or (o3 == 0 and on_segment(b1, a1, b2)) or (o4 == 0 and on_segment(b1, a2, b2))
+
+
+def segment_distance(a1, a2, b1, b2):
+    '''
+    Shortest distance between segments a1-a2 and b1-b2 (0 if they intersect)
+    '''
+    if segments_intersect(a1, a2, b1, b2):
+        return 0
+    return min(point_segment_distance(a1, b1, b2), point_segment_distance(a2, b1, b2),
+               point_segment_distance(b1, a1, a2), point_segment_distance(b2, a1, a2))
@@ -1,5 +1,5 @@
-import sqlite3
 import inkex
+import db_connections
 
 
 
@@ -11,47 +11,66 @@ class WireDBProxy:
         self.wire_db = "wire_db"
         self.init_wire_group_database()
 
+    def connect(self):
+        return db_connections.connect(self.wire_db)
+
+    def close(self, conn):
+        db_connections.close(conn)
+
     def init_wire_group_database(self):
-        conn = sqlite3.connect(self.wire_db)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS wire_group_table
         (wire_IDs text);''')
+        # maps every wire id to the row of its group, so looking up a wire does not scan every group
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS wire_id_table
+        (wire_ID text PRIMARY KEY, group_row integer);''')
+        if cursor.execute('''SELECT COUNT(*) FROM wire_id_table''').fetchone()[0] == 0:
+            # databases written before the id table existed
+            rows = cursor.execute('''SELECT rowid, wire_IDs FROM wire_group_table''').fetchall()
+            cursor.executemany('''
+            INSERT OR REPLACE INTO wire_id_table VALUES (?, ?);''',
+                [(wire_id, row) for row, id_string in rows for wire_id in id_string.split(',')])
         conn.commit()
-        conn.close()
+        self.close(conn)
 
     def insert_new_wire_group(self, wire_ids):
         '''
         wire_ids: list of wireids (strings)
         '''
         id_string = ','.join(wire_ids)
-        conn = sqlite3.connect(self.wire_db)
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
         INSERT into wire_group_table VALUES (?);''', (id_string,))
+        cursor.executemany('''
+        INSERT OR REPLACE INTO wire_id_table VALUES (?, ?);''', [(wire_id, cursor.lastrowid) for wire_id in wire_ids])
         conn.commit()
-        conn.close()
+        self.close(conn)
     
     def retrieve_all_wire_groups(self):
-        conn = sqlite3.connect(self.wire_db)
+        conn = self.connect()
         cursor = conn.cursor()
         result = cursor.execute('''SELECT * FROM wire_group_table''').fetchall()
         groups = []
         for g_tuple in result: groups.extend([wire_id.split(',') for wire_id in g_tuple])
         conn.commit()
-        conn.close()
+        self.close(conn)
         return groups
     
     def retrieve_wire_group_with_id(self, wire_id):
-        conn = sqlite3.connect(self.wire_db)
+        conn = self.connect()
         cursor = conn.cursor()
         result = cursor.execute('''
-        SELECT * FROM wire_group_table WHERE wire_IDs LIKE ('%' || ? || '%');''', (wire_id,)).fetchall()
+        SELECT wire_group_table.wire_IDs FROM wire_id_table JOIN wire_group_table ON wire_group_table.rowid = wire_id_table.group_row
+        WHERE wire_id_table.wire_ID = ?;''', (wire_id,)).fetchall()
         groups = []
         for g_tuple in result: groups.extend([wire_id.split(',') for wire_id in g_tuple])
         inkex.errormsg("what are groups retrieved:{}".format(groups))
         conn.commit()
-        conn.close()
+        self.close(conn)
         return groups[0] if groups != [] else []
     
     def delete_wire_groups_with_id(self, wire_ids):
@@ -69,16 +88,17 @@ class WireDBProxy:
                 groups.append(group)
         
         # delete groupings from table
-        conn = sqlite3.connect(self.wire_db)
+        conn = self.connect()
         cursor = conn.cursor()
         for group in groups:
             group_str = ','.join(group)
             result = cursor.execute(''' DELETE FROM wire_group_table WHERE wire_IDs= ? ''', (group_str,)).fetchall()
+            cursor.executemany(''' DELETE FROM wire_id_table WHERE wire_ID= ? ''', [(w_id,) for w_id in group])
             groups = []
             for g_tuple in result: groups.extend([wire_id.split(',') for wire_id in g_tuple])
             inkex.errormsg("what are groups retrieved:{}".format(groups))
         conn.commit()
-        conn.close()
+        self.close(conn)
         return True
 
 
@@ -0,0 +1,228 @@
+import contextlib
+import importlib
+import io
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import traceback
+from argparse import ArgumentParser
+
+'''
+Optional resident worker for the extension scripts
+
+Inkscape starts a new python process for every effect, which re-imports inkex and numpy
+and starts every cache from scratch. The daemon keeps the effect modules imported, their
+caches (parsed wire geometry) warm and the wire database connections open with the wire
+groups read in, and runs effects sent to it over a unix domain socket by launcher.py.
+The caches check an element's geometry before reusing it, so they stay valid across
+documents, and are bounded so they do not grow for as long as the daemon runs.
+
+Start it with: python worker_daemon.py
+Only the standard library is imported here so launcher.py stays cheap to start.
+'''
+
+# effect name -> (module, effect class)
+EFFECTS = {
+    'create_grid': ('create_grid', 'CreateGridEffect'),
+    'create_custom_grid': ('create_custom_grid', 'CreateCustomGridEffect'),
+    'combine_grids': ('combine_grids', 'CombineGridsEffect'),
+    'make_stitches': ('make_stitches', 'MakeStitchesEffect'),
+}
+
+CONNECT_TIMEOUT = 0.5 # seconds to wait for the daemon before running in process
+
+def get_socket_path():
+    default_path = os.path.join(tempfile.gettempdir(), 'intelligent_textiles_{}.sock'.format(os.getuid() if hasattr(os, 'getuid') else 0))
+    return os.environ.get('INTELLIGENT_TEXTILES_SOCKET', default_path)
+
+
+def send_frame(sock, data):
+    sock.sendall(struct.pack('>Q', len(data)) + data)
+
+
+def recv_exact(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("daemon connection closed early")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    size, = struct.unpack('>Q', recv_exact(sock, 8))
+    return recv_exact(sock, size)
+
+
+def split_input_file(args):
+    '''
+    returns (index of the input document in args, or None)
+    inkscape passes the document as the only positional argument
+    '''
+    for idx in range(len(args) - 1, -1, -1):
+        if not args[idx].startswith('--'):
+            return idx
+    return None
+
+
+def forward(effect_name, args):
+    '''
+    Sends the effect, its arguments and the document to the daemon and writes the result to stdout/stderr
+    returns the effect's exit status, or None if no daemon is running
+    '''
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(get_socket_path()):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(get_socket_path())
+    except OSError:
+        sock.close()
+        return None
+
+    input_idx = split_input_file(args)
+    document = b''
+    if input_idx is not None:
+        with open(args[input_idx], 'rb') as f:
+            document = f.read()
+    elif not sys.stdin.isatty():
+        document = sys.stdin.buffer.read()
+    header = {
+        'effect': effect_name,
+        'args': args,
+        'input_idx': input_idx,
+        'cwd': os.getcwd(),
+        'document_path': os.environ.get('DOCUMENT_PATH', args[input_idx] if input_idx is not None else None),
+    }
+    try:
+        sock.settimeout(None) # effects can take a while
+        send_frame(sock, json.dumps(header).encode('utf-8'))
+        send_frame(sock, document)
+        response = json.loads(recv_frame(sock).decode('utf-8'))
+        output = recv_frame(sock)
+    finally:
+        sock.close()
+    sys.stderr.write(response['stderr'])
+    sys.stdout.buffer.write(output)
+    sys.stdout.flush()
+    return response['status']
+
+
+def run_effect(effect_name, args, output):
+    '''
+    Runs an effect in this process, writing the resulting document to output (stdout if None)
+    returns the exit status
+    '''
+    module_name, class_name = EFFECTS[effect_name]
+    effect_class = getattr(importlib.import_module(module_name), class_name)
+    # the effects read their own options from sys.argv as well as through inkex
+    old_argv = sys.argv
+    sys.argv = [module_name + '.py'] + args
+    try:
+        if output is None:
+            effect_class().run(args)
+        else:
+            effect_class().run(args, output=output)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        sys.argv = old_argv
+    return 0
+
+
+class WorkerDaemon():
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        extension_dir = os.path.dirname(os.path.abspath(__file__))
+        if extension_dir not in sys.path:
+            sys.path.insert(0, extension_dir)
+        # keep every effect and its dependencies imported between requests
+        for module_name, _ in EFFECTS.values():
+            importlib.import_module(module_name)
+        import db_connections
+        db_connections.keep_connections = True
+
+    def warm_wire_groups(self):
+        '''
+        Opens the wire database of the current working directory and reads every wire group,
+        so the connection stays open and its pages are cached for the effect
+        '''
+        import wiredb_proxy
+        wiredb_proxy.WireDBProxy().retrieve_all_wire_groups()
+
+    def handle(self, conn):
+        header = json.loads(recv_frame(conn).decode('utf-8'))
+        document = recv_frame(conn)
+        args = list(header['args'])
+        with tempfile.NamedTemporaryFile(suffix='.svg', delete=False) as f:
+            f.write(document)
+            document_file = f.name
+        if header['input_idx'] is not None:
+            args[header['input_idx']] = document_file
+        else:
+            args.append(document_file)
+
+        stderr = io.StringIO()
+        output = io.BytesIO()
+        old_cwd = os.getcwd()
+        old_document_path = os.environ.get('DOCUMENT_PATH')
+        try:
+            os.chdir(header['cwd']) # the wire database lives in the working directory
+            if header['document_path'] is not None:
+                os.environ['DOCUMENT_PATH'] = header['document_path']
+            with contextlib.redirect_stderr(stderr):
+                try:
+                    self.warm_wire_groups()
+                    status = run_effect(header['effect'], args, output)
+                except Exception: # report the failure to the caller and keep serving
+                    traceback.print_exc()
+                    status = 1
+        finally:
+            os.chdir(old_cwd)
+            if old_document_path is None:
+                os.environ.pop('DOCUMENT_PATH', None)
+            else:
+                os.environ['DOCUMENT_PATH'] = old_document_path
+            os.remove(document_file)
+        send_frame(conn, json.dumps({'status': status, 'stderr': stderr.getvalue()}).encode('utf-8'))
+        send_frame(conn, output.getvalue())
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # create the socket file readable and writable by this user only, there is no window before a chmod
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen()
+        # exit through the finally below so the socket file is removed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        print("intelligent textiles worker listening on {}".format(self.socket_path))
+        try:
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    try:
+                        self.handle(conn)
+                    except (ConnectionError, OSError) as e:
+                        print("request failed: {}".format(e), file=sys.stderr)
+        finally:
+            server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("--socket", type=str, default=get_socket_path(), help="Unix socket to listen on")
+    args = parser.parse_args()
+    WorkerDaemon(args.socket).serve()
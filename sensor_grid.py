@@ -1,7 +1,9 @@
 from .base import InkstitchExtension
+import copy
 import json
 import os
 import sys
+import threading
 from base64 import b64decode
 from argparse import ArgumentParser, REMAINDER
 
@@ -13,7 +15,7 @@ import wx.adv
 from lxml import etree
 
 from ..elements import nodes_to_elements
-from ..gui import PresetsPanel, SimulatorPreview, info_dialog
+from ..gui import PresetsPanel, info_dialog
 from ..i18n import _
 from ..lettering import Font, FontError
 from ..svg import get_correction_transform
@@ -26,10 +28,148 @@ from .lettering_custom_font_dir import get_custom_font_dir
 import svgwrite
 from svgwrite.extensions import Inkscape
 import numpy as np
+from .intelligent_textiles_extension.pin_assignment import assign_pins
+from .intelligent_textiles_extension.connectors import get_connector, is_connector, is_plain_pin
 
 # minimum space apart for wires in grid to avoid interference / shorting
 MIN_GRID_SPACING = 2.5
 BBOX_SPACING = 5
+# wait this long after the last spinner change before laying out the grid again
+LAYOUT_DEBOUNCE_MS = 250
+
+def get_wire_positions(start, end, num_wires):
+    '''
+    num_wires evenly spaced positions strictly between start and end
+    '''
+    return np.linspace(start, end, num_wires + 2)[1:-1]
+
+class GridPreviewModel():
+    '''
+    Wire positions of the previewed grid as arrays, with the routed wire points of each axis
+    A model is not changed once built: changing a wire count builds a new model that
+    keeps the axis whose count stayed the same, so models can be handed between threads
+    '''
+    def __init__(self, rectangle):
+        self.rectangle = rectangle
+        self.num_horizontal_wires = 0
+        self.num_vertical_wires = 0
+        self.horizontal_positions = np.zeros(0) # y of every horizontal wire, bottom to top
+        self.vertical_positions = np.zeros(0) # x of every vertical wire, left to right
+        self.horizontal_points = [] # (x, y) points of the routed horizontal wire
+        self.vertical_points = []
+        self.num_unconnected_horizontal = 0 # wire ends left without a pin, reported when the grid is applied
+        self.num_unconnected_vertical = 0
+
+    def with_wire_counts(self, num_horizontal_wires, num_vertical_wires, horizontal_connectors, vertical_connectors, cancel_event):
+        '''
+        returns new model for the given wire counts, or None if cancel_event was set
+        every recomputed axis assigns the pins of its connectors anew
+        '''
+        model = copy.copy(self)
+        if num_horizontal_wires != self.num_horizontal_wires:
+            model.num_horizontal_wires = num_horizontal_wires
+            model.horizontal_positions = get_wire_positions(self.rectangle.bottom, self.rectangle.top, num_horizontal_wires)
+            model.horizontal_points = model.lay_horizontal_wires(horizontal_connectors, cancel_event)
+            if model.horizontal_points is None:
+                return None
+        if num_vertical_wires != self.num_vertical_wires:
+            model.num_vertical_wires = num_vertical_wires
+            model.vertical_positions = get_wire_positions(self.rectangle.left, self.rectangle.right, num_vertical_wires)
+            model.vertical_points = model.lay_vertical_wires(vertical_connectors, cancel_event)
+            if model.vertical_points is None:
+                return None
+        return model
+
+    def lay_horizontal_wires(self, connectors, cancel_event):
+        '''
+        returns points of one wire snaking through every horizontal position, or None if cancel_event was set
+        '''
+        points = []
+        # the wire leaves for a pin at the right edge on every other position
+        ends = self.horizontal_positions[::2]
+        connections, self.num_unconnected_horizontal = connect_wire_ends(connectors, np.column_stack([np.full(len(ends), self.rectangle.right), ends]))
+        for wire_count, y in enumerate(self.horizontal_positions):
+            if cancel_event.is_set():
+                return None
+            if wire_count % 2 == 0:
+                points.append((self.rectangle.left - BBOX_SPACING, y))
+                points.append((self.rectangle.right, y))
+                points.extend((x, y) for x, y in connections[wire_count // 2])
+            else:
+                points.append((self.rectangle.right, y))
+                points.append((self.rectangle.left - BBOX_SPACING, y))
+        return points
+
+    def lay_vertical_wires(self, connectors, cancel_event):
+        '''
+        returns points of one wire snaking through every vertical position, or None if cancel_event was set
+        '''
+        points = []
+        # the wire leaves for a pin at the bottom edge on every other position
+        ends = self.vertical_positions[::2]
+        connections, self.num_unconnected_vertical = connect_wire_ends(connectors, np.column_stack([ends, np.full(len(ends), self.rectangle.bottom)]))
+        for wire_count, x in enumerate(self.vertical_positions):
+            if cancel_event.is_set():
+                return None
+            if wire_count % 2 == 0:
+                points.append((x, self.rectangle.top - BBOX_SPACING))
+                points.append((x, self.rectangle.bottom))
+                points.extend((x, y) for x, y in connections[wire_count // 2])
+            else:
+                points.append((x, self.rectangle.bottom))
+                points.append((x, self.rectangle.top - BBOX_SPACING))
+        return points
+
+class GridPreviewPanel(wx.Panel):
+    '''
+    Draws the previewed grid over the shape's bounding box without touching the document
+    '''
+    MARGIN = 10 # pixels around the drawing
+
+    def __init__(self, parent, rectangle):
+        wx.Panel.__init__(self, parent, wx.ID_ANY)
+        self.rectangle = rectangle
+        self.model = None
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.Bind(wx.EVT_PAINT, self.on_paint)
+        self.Bind(wx.EVT_SIZE, lambda event: self.Refresh())
+
+    def set_model(self, model):
+        self.model = model
+        self.Refresh()
+
+    def get_transform(self, points):
+        '''
+        returns (scale, x offset, y offset) fitting the bounding box and points into the panel
+        '''
+        xs = np.array([self.rectangle.left - BBOX_SPACING, self.rectangle.right] + [p[0] for p in points])
+        ys = np.array([self.rectangle.top - BBOX_SPACING, self.rectangle.bottom] + [p[1] for p in points])
+        width, height = self.GetClientSize()
+        span_x = max(xs.max() - xs.min(), 1e-6)
+        span_y = max(ys.max() - ys.min(), 1e-6)
+        scale = min((width - 2 * self.MARGIN) / span_x, (height - 2 * self.MARGIN) / span_y)
+        return scale, self.MARGIN - xs.min() * scale, self.MARGIN - ys.min() * scale
+
+    def on_paint(self, event):
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.WHITE_BRUSH)
+        dc.Clear()
+        model = self.model
+        wires = [] if model is None else [(model.horizontal_points, wx.RED), (model.vertical_points, wx.BLUE)]
+        scale, offset_x, offset_y = self.get_transform([p for points, _ in wires for p in points])
+        def to_panel(x, y):
+            return wx.Point(int(round(x * scale + offset_x)), int(round(y * scale + offset_y)))
+
+        dc.SetPen(wx.Pen(wx.Colour(160, 160, 160), 1, wx.PENSTYLE_SHORT_DASH))
+        dc.SetBrush(wx.TRANSPARENT_BRUSH)
+        top_left = to_panel(self.rectangle.left, self.rectangle.top)
+        bottom_right = to_panel(self.rectangle.right, self.rectangle.bottom)
+        dc.DrawRectangle(wx.Rect(top_left, bottom_right))
+        for points, colour in wires:
+            if len(points) > 1:
+                dc.SetPen(wx.Pen(colour, 1))
+                dc.DrawLines([to_panel(x, y) for x, y in points])
+
 class SensorGridFrame(wx.Frame):
     DEFAULT_FONT = "small_font"
     def __init__(self, shape_points, rectangle, wire_connector, svg, *args, **kwargs):
@@ -40,16 +180,19 @@ class SensorGridFrame(wx.Frame):
             lc.Init(wx.LANGUAGE_DEFAULT)  
         self.shape_points = shape_points
         self.rectangle = rectangle
-        self.vertical_wire_connector, self.horizontal_wire_connector = wire_connector
+        self.horizontal_wire_connectors, self.vertical_wire_connectors = split_connectors(wire_connector, self.rectangle)
         self.upper_left, self.upper_right, self.lower_left, self.lower_right = self.rectangle.get_rectangle_points()
         self.svg = svg
         self.paths = []
+        self.preview_model = GridPreviewModel(self.rectangle) # latest finished layout
+        self.layout_timer = None # debounces spinner changes
+        self.layout_cancel_event = None # set to cancel the layout being computed
         
         self.cancel_hook = kwargs.pop('on_cancel', None)
         wx.Frame.__init__(self, None, wx.ID_ANY,
                           _("Ink/Stitch Sensor Grid")
                           ) 
-        self.preview = SimulatorPreview(self, target_duration=1)
+        self.preview = GridPreviewPanel(self, self.rectangle)
         # self.presets_panel = PresetsPanel(self)
 
         self.vertical_wire_spinner = wx.SpinCtrl(self, wx.ID_ANY, min = 1, initial = 1);
@@ -71,6 +214,7 @@ class SensorGridFrame(wx.Frame):
         self.__do_layout()
         self.load_settings()
         self.apply_settings()
+        self.start_layout() # first preview, for the initial spinner values
 
     
     def load_settings(self):
@@ -89,87 +233,106 @@ class SensorGridFrame(wx.Frame):
 
     def on_change(self, attribute, event):
         self.settings[attribute] = event.GetEventObject().GetValue()
-        self.preview.update() 
+        # spinner ticks restart the timer, so the layout is only computed once the value settles
+        if self.layout_timer is None:
+            self.layout_timer = wx.CallLater(LAYOUT_DEBOUNCE_MS, self.start_layout)
+        else:
+            self.layout_timer.Start(LAYOUT_DEBOUNCE_MS)
 
+    def start_layout(self, on_done=None):
+        '''
+        Computes the layout for the current spinner values on a worker thread,
+        cancelling the layout that is still being computed, if any
+        on_done: called on the UI thread with (layout, error message), refreshes the preview by default
+        '''
+        self.cancel_layout()
+        cancel_event = threading.Event()
+        self.layout_cancel_event = cancel_event
+        layout_thread = threading.Thread(target=self.layout_worker,
+                                         args=(self.preview_model, self.horizontal_wire_spinner.GetValue(), self.vertical_wire_spinner.GetValue(),
+                                               cancel_event, on_done or self.on_layout_ready))
+        layout_thread.daemon = True
+        layout_thread.start()
+
+    def layout_worker(self, model, num_horizontal_wires, num_vertical_wires, cancel_event, on_done):
+        layout, error = self.compute_grid_layout(model, num_horizontal_wires, num_vertical_wires, cancel_event)
+        if not cancel_event.is_set():
+            wx.CallAfter(self.finish_layout, layout, error, cancel_event, on_done)
+
+    def finish_layout(self, layout, error, cancel_event, on_done):
+        # drop results of layouts that were cancelled while this call was queued
+        if cancel_event.is_set() or cancel_event is not self.layout_cancel_event:
+            return
+        self.layout_cancel_event = None
+        on_done(layout, error)
+
+    def cancel_layout(self):
+        if self.layout_timer is not None:
+            self.layout_timer.Stop()
+        if self.layout_cancel_event is not None:
+            self.layout_cancel_event.set()
+            self.layout_cancel_event = None
+
+    def on_layout_ready(self, layout, error):
+        # spacing errors are only reported when applying
+        if layout is not None:
+            self.preview_model = layout
+            self.preview.set_model(layout)
 
     def apply(self, event):
-        self.preview.disable()
-        self.create_grid_layout()
+        self.apply_button.Disable()
+        model = self.preview_model
+        if model.num_horizontal_wires == self.horizontal_wire_spinner.GetValue() \
+                and model.num_vertical_wires == self.vertical_wire_spinner.GetValue():
+            self.commit_layout(model, None)
+        else:
+            # the document is written to once the layout for the current values is ready
+            self.start_layout(on_done=self.commit_layout)
+
+    def commit_layout(self, layout, error):
+        '''
+        The only place the grid is written to the document
+        '''
+        if error is not None:
+            inkex.errormsg(error)
+        elif layout is not None:
+            num_unconnected = layout.num_unconnected_horizontal + layout.num_unconnected_vertical
+            if num_unconnected != 0:
+                inkex.errormsg("connector has no more open connections for {} wires. Decrease the number of wires!".format(num_unconnected))
+            self.create_path(layout.horizontal_points, is_horizontal=True)
+            self.create_path(layout.vertical_points, is_horizontal=False)
         # self.save_settings()
         self.close()
 
-    def create_grid_layout(self):
+    def compute_grid_layout(self, model, num_horizontal_wires, num_vertical_wires, cancel_event):
+        '''
+        Runs on the layout thread, so it must not touch the document or any widget
+        model: the previous GridPreviewModel, its axes are reused where the wire count has not changed
+        returns (GridPreviewModel or None if cancelled, error message or None)
+        '''
         # check vertical and horizontal spacing
-        total_horizontal_spacing = self.rectangle.height / (self.horizontal_wire_spinner.GetValue() + 1)
-        total_vertical_spacing = self.rectangle.width / (self.vertical_wire_spinner.GetValue() + 1)
+        total_horizontal_spacing = self.rectangle.height / (num_horizontal_wires + 1)
+        total_vertical_spacing = self.rectangle.width / (num_vertical_wires + 1)
         # can only actually add wires within boundaries of rectangle
-        horizontal_wire_spacing = (self.rectangle.height - total_horizontal_spacing) / self.horizontal_wire_spinner.GetValue()
-        vertical_wire_spacing = (self.rectangle.width - total_vertical_spacing) / self.vertical_wire_spinner.GetValue()
+        horizontal_wire_spacing = (self.rectangle.height - total_horizontal_spacing) / num_horizontal_wires
+        vertical_wire_spacing = (self.rectangle.width - total_vertical_spacing) / num_vertical_wires
         if (horizontal_wire_spacing < MIN_GRID_SPACING):
-            inkex.errormsg('''The horizontal wires must be at least {} mm apart
+            return None, '''The horizontal wires must be at least {} mm apart
                             They are currently {} mm apart. Either decrease the
-                            number of wires or increase the size of the grid and try again.'''.format(MIN_GRID_SPACING, horizontal_wire_spacing))
-            return
+                            number of wires or increase the size of the grid and try again.'''.format(MIN_GRID_SPACING, horizontal_wire_spacing)
         if (vertical_wire_spacing < MIN_GRID_SPACING):
-            inkex.errormsg('''The vertical wires must be at least {} mm apart 
+            return None, '''The vertical wires must be at least {} mm apart 
                             They are currently {} mm apart. Either decrease the
-                            number of wires or increase the size of the grid and try again.'''.format(MIN_GRID_SPACING, vertical_wire_spacing))
-            return
-        self.lay_horizontal_wires(total_horizontal_spacing)
-        self.lay_vertical_wires(total_vertical_spacing)
-
-    def lay_horizontal_wires(self, horizontal_wire_spacing):
-        curr_point = list(self.lower_left)
-        wire_count = 0
-        points = []
-        while round(curr_point[1]) != round(self.rectangle.top + horizontal_wire_spacing):
-            curr_point[1] -= horizontal_wire_spacing
-            connections = []
-            if self.horizontal_wire_connector.has_available_wires():
-                connections = self.horizontal_wire_connector.connect_wire()
-            if wire_count % 2 == 0:
-                points.append('{},{}'.format(self.rectangle.left - BBOX_SPACING, curr_point[1]))
-                points.append('{},{}'.format(self.rectangle.right, curr_point[1]))
-                for p in connections:
-                    points.append('{},{}'.format(p.x, p.y))
-            else:
-                points.append('{},{}'.format(self.rectangle.right, curr_point[1]))
-                points.append('{},{}'.format(self.rectangle.left - BBOX_SPACING, curr_point[1]))
-
-            wire_count += 1
-
-        self.create_path(points, is_horizontal=True)
-
-    def lay_vertical_wires(self, vertical_wire_spacing):
-        curr_point = list(self.upper_left)
-        wire_count = 0
-        points = []
-        while round(curr_point[0]) != round(self.rectangle.right - vertical_wire_spacing):
-            curr_point[0] += vertical_wire_spacing
-            connections = []
-            if self.vertical_wire_connector.has_available_wires():
-                connections = self.vertical_wire_connector.connect_wire()
-            if wire_count % 2 == 0:
-                points.append('{},{}'.format(curr_point[0], self.rectangle.top - BBOX_SPACING))
-                points.append('{},{}'.format(curr_point[0], self.rectangle.bottom))
-                for p in connections:
-                    points.append('{},{}'.format(p.x, p.y))
-            else:
-                points.append('{},{}'.format(curr_point[0], self.rectangle.bottom))
-                points.append('{},{}'.format(curr_point[0], self.rectangle.top - BBOX_SPACING))
-            
-            wire_count += 1
-
-        
-        inkex.errormsg("vertical points:{}".format(points))
-        self.create_path(points, is_horizontal=False)
+                            number of wires or increase the size of the grid and try again.'''.format(MIN_GRID_SPACING, vertical_wire_spacing)
+        return model.with_wire_counts(num_horizontal_wires, num_vertical_wires,
+                                      self.horizontal_wire_connectors, self.vertical_wire_connectors, cancel_event), None
 
     def create_path(self, points, is_horizontal):
         '''
         Creates a wire segment path given all of the points sequentially
         '''
         color = "red" if is_horizontal else "blue"
-        path_str = ' '.join(points)
+        path_str = ' '.join('{},{}'.format(x, y) for x, y in points)
         path = inkex.Polyline(attrib={
         'id': "wire_segment",
         'style': "stroke: %s; stroke-width: 0.4; fill: none; stroke-dasharray:0.4,0.4" % color,
@@ -184,7 +347,7 @@ class SensorGridFrame(wx.Frame):
             self.vertical_wire = path
 
     def close(self):
-        self.preview.close()
+        self.cancel_layout()
         self.Destroy()
 
     def cancel(self, event):
@@ -201,6 +364,7 @@ class SensorGridFrame(wx.Frame):
         wire_sizer.Add(wx.StaticText(self, wx.ID_ANY, "Number of horizontal wires"), 0, wx.LEFT | wx.ALIGN_CENTRE_VERTICAL, 0)
         wire_sizer.Add(self.horizontal_wire_spinner, 0, wx.LEFT, 10)
         outer_sizer.Add(wire_sizer, 0, wx.EXPAND | wx.LEFT | wx.TOP | wx.RIGHT, 10)
+        outer_sizer.Add(self.preview, 1, wx.EXPAND | wx.ALL, 10)
 
 
         buttons_sizer = wx.BoxSizer(wx.HORIZONTAL)
@@ -238,24 +402,32 @@ class BoundingBoxMetadata():
             (self.right, self.bottom)
             ]
 
-class Connector():
+def split_connectors(connectors, rectangle):
     '''
-    Object to represent connector of wires
+    Connectors further right of the grid than below it take the horizontal wires, which leave from the right edge,
+    the others take the vertical wires, which leave from the bottom edge
+    returns horizontal connectors, vertical connectors
     '''
-    def __init__(self, connector_points):
-        self.connector_points = connector_points # all coords where wires need to route to 
-        self.open_wire_idx = 0 # idx of next available wire
-        inkex.errormsg("num connectors:{}".format(len(self.connector_points)))
-    def has_available_wires(self):
-        return self.open_wire_idx <= len(self.connector_points) - 4 # every connector is 4 points
-    def connect_wire(self):
-        if self.has_available_wires():
-            points = self.connector_points[self.open_wire_idx:self.open_wire_idx + 4]
-            self.open_wire_idx += 2
-            return points
+    horizontal_connectors, vertical_connectors = [], []
+    for connector in connectors:
+        bbox = connector.bounding_box()
+        if bbox.center_x - rectangle.right > bbox.center_y - rectangle.bottom:
+            horizontal_connectors.append(connector)
         else:
-            inkex.errormsg("connector has no more open connections. Decrease the number of wires!")
-            return None
+            vertical_connectors.append(connector)
+    return horizontal_connectors, vertical_connectors
+
+def connect_wire_ends(connectors, wire_ends):
+    '''
+    Assigns pins of any of the connectors to the wire ends, keeping traces short and uncrossed
+    Runs on the layout thread, so shortages are counted here and reported by the caller
+    returns list with the pin points of every wire end, empty for ends left without a pin,
+    and the number of ends left without a pin, 0 when there are no connectors to route to
+    '''
+    if len(connectors) == 0:
+        return [[] for _ in range(len(wire_ends))], 0
+    assignment = assign_pins(wire_ends, [connector.get_pin_positions() for connector in connectors])
+    return [[] if pin is None else connectors[pin[0]].pin_points[pin[1]] for pin in assignment], assignment.count(None)
 
 
 
@@ -272,15 +444,16 @@ class SensorGrid(InkstitchExtension):
 
         rectangle = None
         shape_points = None
-        connector_points = []
-        connectors = [] # list of connector objects
+        connectors = [] # list of ConnectorModel objects
         for elem in self.svg.get_selected(): # PATH ELEMENT
             '''
-            need this for loop for when multiple elements are selected (object , 2 connectors[?])
-            for now it is just the object itself
+            the object plus any number of connectors, either marked connectors or plain pin paths
             '''
             inkex.errormsg("things selected:{}".format(len(self.svg.get_selected())))
             inkex.errormsg("type of elem:{}".format(type(elem)))
+            if is_connector(elem):
+                connectors.append(get_connector(elem))
+                continue
             shape_points = [p for p in elem.path.end_points]
             inkex.errormsg("points:{},{}".format(shape_points,len(shape_points)))
             
@@ -290,14 +463,10 @@ class SensorGrid(InkstitchExtension):
                 bbox = elem.bounding_box()
                 rectangle = BoundingBoxMetadata(bbox.width, bbox.height, bbox.top, bbox.bottom, bbox.left, bbox.right)
                 inkex.errormsg("rect points:{}".format(rectangle.get_rectangle_points()))
-            elif len(shape_points) == 4:
-                # first and last points represent the ends that will be used for routing!
-                for p in shape_points:
-                    connector_points.append(p)
-                if len(connector_points) == 64: # num of points making up a connector
-                    connectors.append(Connector(connector_points))
-                    connector_points = []
-                
+            elif is_plain_pin(elem):
+                connectors.append(get_connector(elem))
+        inkex.errormsg("num connectors:{}".format(len(connectors)))
+
 
         # if shape_points is not None and rectangle is not None and len(connectors) > 0:
         if True: